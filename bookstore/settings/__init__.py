@@ -0,0 +1,10 @@
+import os
+
+PROFILE = os.getenv('DJANGO_PROFILE', 'dev')
+
+if PROFILE == 'prod':
+    from .prod import *  # noqa: F401,F403
+elif PROFILE == 'dev':
+    from .dev import *  # noqa: F401,F403
+else:
+    raise ValueError(f'Unknown DJANGO_PROFILE {PROFILE!r}, expected "dev" or "prod".')
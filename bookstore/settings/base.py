@@ -0,0 +1,247 @@
+"""
+Settings shared by every profile of the bookstore project.
+
+Generated by 'django-admin startproject' using Django 4.2.15.
+
+For more information on this file, see
+https://docs.djangoproject.com/en/4.2/topics/settings/
+
+For the full list of settings and their values, see
+https://docs.djangoproject.com/en/4.2/ref/settings/
+"""
+import os
+from pathlib import Path
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# Build paths inside the project like this: BASE_DIR / 'subdir'.
+BASE_DIR = Path(__file__).resolve().parent.parent.parent
+
+# Quick-start development settings - unsuitable for production
+# See https://docs.djangoproject.com/en/4.2/howto/deployment/checklist/
+
+# SECURITY WARNING: keep the secret key used in production secret!
+SECRET_KEY = os.getenv('DJANGO_SECRET_KEY')
+
+# SECURITY WARNING: don't run with debug turned on in production!
+DEBUG = False
+
+ALLOWED_HOSTS = [host for host in os.getenv('ALLOWED_HOSTS', '').split(',') if host]
+
+# Application definition
+
+INSTALLED_APPS = [
+    'django.contrib.admin',
+    'django.contrib.auth',
+    'django.contrib.contenttypes',
+    'django.contrib.sessions',
+    'django.contrib.messages',
+    'django.contrib.staticfiles',
+
+    'rest_framework',
+    'django_filters',
+    'social_django',
+
+    'store',
+]
+
+MIDDLEWARE = [
+    'store.instrumentation.InstrumentationMiddleware',
+    'django.middleware.security.SecurityMiddleware',
+    'django.contrib.sessions.middleware.SessionMiddleware',
+    'django.middleware.common.CommonMiddleware',
+    'django.middleware.csrf.CsrfViewMiddleware',
+    'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'store.routers.ReadYourWritesMiddleware',
+    'django.contrib.messages.middleware.MessageMiddleware',
+    'django.middleware.clickjacking.XFrameOptionsMiddleware',
+]
+
+ROOT_URLCONF = 'bookstore.urls'
+
+TEMPLATES = [
+    {
+        'BACKEND': 'django.template.backends.django.DjangoTemplates',
+        'DIRS': [BASE_DIR / 'templates'],
+        'APP_DIRS': True,
+        'OPTIONS': {
+            'context_processors': [
+                'django.template.context_processors.debug',
+                'django.template.context_processors.request',
+                'django.contrib.auth.context_processors.auth',
+                'django.contrib.messages.context_processors.messages',
+            ],
+        },
+    },
+]
+
+WSGI_APPLICATION = 'bookstore.wsgi.application'
+
+# Database
+# https://docs.djangoproject.com/en/4.2/ref/settings/#databases
+
+DATABASES = {
+    'default': {
+        'ENGINE': os.getenv('DB_ENGINE'),
+        'NAME': os.getenv('DB_NAME'),
+        'USER': os.getenv('DB_USER'),
+        'PASSWORD': os.getenv('DB_PASSWORD'),
+        'HOST': os.getenv('DB_HOST'),
+        'PORT': os.getenv('DB_PORT'),
+    }
+}
+
+
+# Read replicas of the default database, used for safe BookViewSet requests.
+# DB_REPLICA_HOSTS and DB_REPLICA_NAMES are comma separated and matched by
+# position, anything not given is copied from the default database. For a
+# local setup, DB_REPLICA_NAMES can point at copies of a SQLite file.
+REPLICA_HOSTS = [host for host in os.getenv('DB_REPLICA_HOSTS', '').split(',') if host]
+REPLICA_NAMES = [name for name in os.getenv('DB_REPLICA_NAMES', '').split(',') if name]
+
+STORE_READ_REPLICAS = []
+for index in range(max(len(REPLICA_HOSTS), len(REPLICA_NAMES))):
+    alias = f'replica_{index + 1}'
+    DATABASES[alias] = {
+        **DATABASES['default'],
+        'HOST': REPLICA_HOSTS[index] if index < len(REPLICA_HOSTS) else DATABASES['default']['HOST'],
+        'NAME': REPLICA_NAMES[index] if index < len(REPLICA_NAMES) else DATABASES['default']['NAME'],
+        'TEST': {'MIRROR': 'default'},
+    }
+    STORE_READ_REPLICAS.append(alias)
+
+DATABASE_ROUTERS = ['store.routers.ReplicaRouter']
+
+STORE_REPLICA_HEALTH_TTL = int(os.getenv('STORE_REPLICA_HEALTH_TTL', '10'))
+
+STORE_REPLICA_STICKY_SECONDS = int(os.getenv('STORE_REPLICA_STICKY_SECONDS', '5'))
+
+AUTHENTICATION_BACKENDS = (
+    'social_core.backends.github.GithubOAuth2',
+    'django.contrib.auth.backends.ModelBackend',
+)
+
+# Password validation
+# https://docs.djangoproject.com/en/4.2/ref/settings/#auth-password-validators
+
+AUTH_PASSWORD_VALIDATORS = [
+    {
+        'NAME': 'django.contrib.auth.password_validation.UserAttributeSimilarityValidator',
+    },
+    {
+        'NAME': 'django.contrib.auth.password_validation.MinimumLengthValidator',
+    },
+    {
+        'NAME': 'django.contrib.auth.password_validation.CommonPasswordValidator',
+    },
+    {
+        'NAME': 'django.contrib.auth.password_validation.NumericPasswordValidator',
+    },
+]
+
+# Internationalization
+# https://docs.djangoproject.com/en/4.2/topics/i18n/
+
+LANGUAGE_CODE = 'en-us'
+
+TIME_ZONE = 'UTC'
+
+USE_I18N = True
+
+USE_TZ = True
+
+# Static files (CSS, JavaScript, Images)
+# https://docs.djangoproject.com/en/4.2/howto/static-files/
+
+STATIC_URL = 'static/'
+
+# Default primary key field type
+# https://docs.djangoproject.com/en/4.2/ref/settings/#default-auto-field
+
+DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
+
+REST_FRAMEWORK = {
+    'DEFAULT_RENDERER_CLASSES': (
+        'rest_framework.renderers.JSONRenderer',
+    ),
+    'DEFAULT_PARSER_CLASSES': (
+        'rest_framework.parsers.JSONParser',
+    )
+}
+
+STORE_TOP_READERS = int(os.getenv('STORE_TOP_READERS', '10'))
+
+STORE_DEFERRED_COUNTERS = os.getenv('STORE_DEFERRED_COUNTERS', 'False') == 'True'
+
+# Seconds a relation change may take from its updated_at stamp to commit.
+# The changes feed sends rows younger than this again on the next call.
+STORE_CHANGES_SAFETY_WINDOW = int(os.getenv('STORE_CHANGES_SAFETY_WINDOW', '10'))
+
+# Books kept per leaderboard, and how many votes at the catalog mean every
+# book starts with when ranking by Bayesian weighted rating.
+STORE_RANKING_SIZE = int(os.getenv('STORE_RANKING_SIZE', '100'))
+
+STORE_RANKING_PRIOR_VOTES = int(os.getenv('STORE_RANKING_PRIOR_VOTES', '10'))
+
+# Neighbours stored per book by build_similar_books.
+STORE_SIMILAR_BOOKS = int(os.getenv('STORE_SIMILAR_BOOKS', '20'))
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    'books': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'books',
+        'OPTIONS': {
+            'MAX_ENTRIES': int(os.getenv('STORE_CACHE_MAX_ENTRIES', '1000')),
+        },
+    },
+}
+
+if os.getenv('STORE_CACHE_REDIS_URL'):
+    CACHES['books'] = {
+        'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+        'LOCATION': os.getenv('STORE_CACHE_REDIS_URL'),
+    }
+
+STORE_CACHE_ALIAS = 'books'
+
+# Writes invalidate cached responses through a version kept in the cache
+# itself. Other worker processes never see a bump made in a process-local
+# backend, so responses are only cached in one when this is set, which is
+# safe for a single process such as runserver.
+STORE_CACHE_ALLOW_LOCAL = os.getenv('STORE_CACHE_ALLOW_LOCAL', 'False') == 'True'
+
+STORE_CACHE_TIMEOUT = int(os.getenv('STORE_CACHE_TIMEOUT', '300'))
+
+STORE_SERVER_TIMING = os.getenv('STORE_SERVER_TIMING', 'True') == 'True'
+
+# Limits on queries, SQL milliseconds and response bytes, keyed by
+# 'METHOD route' or by route for every method. Going over logs a warning,
+# or raises when STORE_BUDGET_ACTION is 'raise'.
+STORE_ROUTE_BUDGETS = {
+    'GET book-list': {'queries': 4, 'sql_ms': 200},
+    'GET book-detail': {'queries': 5, 'sql_ms': 100},
+    'GET book-suggest': {'queries': 4, 'sql_ms': 50},
+    'GET userbookrelation-list': {'queries': 3, 'sql_ms': 50},
+    'PATCH userbookrelation-detail': {'queries': 10, 'sql_ms': 100},
+    'POST userbookrelation-bulk': {'queries': 16, 'sql_ms': 1000},
+}
+
+STORE_BUDGET_ACTION = os.getenv('STORE_BUDGET_ACTION', 'log')
+
+# /metrics/ is served to staff users and to scrapers sending
+# "Authorization: Bearer <STORE_METRICS_TOKEN>".
+STORE_METRICS_TOKEN = os.getenv('STORE_METRICS_TOKEN')
+
+SOCIAL_AUTH_JSONFIELD_ENABLED = True
+
+SOCIAL_AUTH_GITHUB_KEY = os.getenv('CLIENT_ID')
+SOCIAL_AUTH_GITHUB_SECRET = os.getenv('CLIENT_SECRET')
+
+INTERNAL_IPS = [
+    "127.0.0.1",
+]
@@ -0,0 +1,40 @@
+import os
+
+from .base import *  # noqa: F401,F403
+from .base import DATABASES, TEMPLATES
+
+DEBUG = False
+
+# Keep connections open across requests and check them before reuse instead
+# of connecting once per request. The replicas were copied from default
+# before this, so every alias gets the settings.
+DATABASES = {
+    alias: {
+        **database,
+        'CONN_MAX_AGE': int(os.getenv('DB_CONN_MAX_AGE', '600')),
+        'CONN_HEALTH_CHECKS': True,
+    }
+    for alias, database in DATABASES.items()
+}
+
+TEMPLATES = [
+    {
+        **TEMPLATES[0],
+        'APP_DIRS': False,
+        'OPTIONS': {
+            'context_processors': [
+                'django.template.context_processors.request',
+                'django.contrib.auth.context_processors.auth',
+                'django.contrib.messages.context_processors.messages',
+            ],
+            'loaders': [
+                ('django.template.loaders.cached.Loader', [
+                    'django.template.loaders.filesystem.Loader',
+                    'django.template.loaders.app_directories.Loader',
+                ]),
+            ],
+        },
+    },
+]
+
+STORE_SERVER_TIMING = os.getenv('STORE_SERVER_TIMING', 'False') == 'True'
@@ -14,12 +14,13 @@ Including another URLconf
     1. Import the include() function: from django.urls import include, path
     2. Add a URL to urlpatterns:  path('blog/', include('blog.urls'))
 """
+from django.conf import settings
 from django.contrib import admin
 from django.urls import path, re_path, include
 from rest_framework.routers import SimpleRouter
-from debug_toolbar.toolbar import debug_toolbar_urls
 
-from store.views import BookViewSet, auth, UserBookRelationView
+from store.instrumentation import metrics
+from store.views import BookViewSet, auth, UserBookRelationView, book_detail_async, book_list_async
 
 router = SimpleRouter()
 router.register(r'book', BookViewSet)
@@ -29,7 +30,14 @@ urlpatterns = [
     path('admin/', admin.site.urls),
     re_path('', include('social_django.urls', namespace='social')),
     path('auth/', auth),
+    path('metrics/', metrics),
+    path('async/book/', book_list_async, name='book-list-async'),
+    path('async/book/<int:pk>/', book_detail_async, name='book-detail-async'),
 ]
 
 urlpatterns += router.urls
-urlpatterns += debug_toolbar_urls()
+
+if 'debug_toolbar' in settings.INSTALLED_APPS:
+    from debug_toolbar.toolbar import debug_toolbar_urls
+
+    urlpatterns += debug_toolbar_urls()
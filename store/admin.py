@@ -1,13 +1,65 @@
+import json
+
 from django.contrib import admin
+from django.core.paginator import Paginator
+from django.db import connections
+from django.utils.functional import cached_property
 
 from store.models import Book, UserBookRelation
 
 
+class EstimatedCountPaginator(Paginator):
+    # Counting tens of millions of rows takes seconds on PostgreSQL, so large
+    # changelists use the planner's estimate and only small ones are counted.
+    exact_below = 10000
+
+    @cached_property
+    def count(self):
+        queryset = self.object_list
+        if connections[queryset.db].vendor == 'postgresql':
+            estimate = estimated_count(queryset)
+            if estimate >= self.exact_below:
+                return estimate
+        return super().count
+
+
+def estimated_count(queryset):
+    connection = connections[queryset.db]
+    if not queryset.query.where:
+        with connection.cursor() as cursor:
+            cursor.execute(
+                'SELECT reltuples::bigint FROM pg_class WHERE oid = %s::regclass', [queryset.model._meta.db_table]
+            )
+            row = cursor.fetchone()
+        # reltuples is -1 until the table has been analyzed.
+        return row[0] if row and row[0] > 0 else 0
+
+    plan = json.loads(queryset.order_by().explain(format='json'))
+    return int(plan[0]['Plan']['Plan Rows'])
+
+
 @admin.register(Book)
 class BookAdmin(admin.ModelAdmin):
-    pass
+    list_display = ['id', 'name', 'author_name', 'price', 'discount', 'owner', 'rating', 'readers_count']
+    list_select_related = ['owner']
+    list_filter = [('updated_at', admin.DateFieldListFilter)]
+    # Prefix searches are served by the UPPER() btree and NOCASE indexes of
+    # migration 0012.
+    search_fields = ['^name', '^author_name']
+    raw_id_fields = ['owner']
+    ordering = ['-id']
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
 
 
 @admin.register(UserBookRelation)
-class UserBookRelation(admin.ModelAdmin):
-    pass
+class UserBookRelationAdmin(admin.ModelAdmin):
+    list_display = ['id', 'user', 'book', 'like', 'in_bookmarks', 'rate', 'updated_at']
+    list_select_related = ['user', 'book']
+    list_filter = ['like', 'in_bookmarks']
+    search_fields = ['user__username__exact']
+    raw_id_fields = ['user']
+    autocomplete_fields = ['book']
+    ordering = ['-id']
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
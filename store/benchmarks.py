@@ -0,0 +1,15 @@
+import statistics
+
+
+def summarize(timings, elapsed, concurrency):
+    latencies = sorted(latency * 1000 for latency, _ in timings)
+    percentiles = statistics.quantiles(latencies, n=100) if len(latencies) > 1 else latencies * 99
+    return {
+        'requests': len(timings),
+        'concurrency': concurrency,
+        'errors': sum(1 for _, ok in timings if not ok),
+        'requests_per_second': round(len(timings) / elapsed, 1),
+        'p50_ms': round(percentiles[49], 2),
+        'p95_ms': round(percentiles[94], 2),
+        'p99_ms': round(percentiles[98], 2),
+    }
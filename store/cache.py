@@ -0,0 +1,101 @@
+import hashlib
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+
+VERSION_KEY = 'books:version'
+HITS_KEY = 'books:hits'
+MISSES_KEY = 'books:misses'
+
+PROCESS_LOCAL_BACKENDS = (
+    'django.core.cache.backends.locmem.LocMemCache',
+    'django.core.cache.backends.dummy.DummyCache',
+)
+
+
+def get_cache():
+    return caches[settings.STORE_CACHE_ALIAS]
+
+
+def cache_shared():
+    backend = settings.CACHES[settings.STORE_CACHE_ALIAS]['BACKEND']
+    return backend not in PROCESS_LOCAL_BACKENDS or settings.STORE_CACHE_ALLOW_LOCAL
+
+
+def get_version():
+    cache = get_cache()
+    version = cache.get(VERSION_KEY)
+    if version is None:
+        # Start from the clock so an evicted or restarted version never
+        # reuses a number that older entries were stored under.
+        cache.add(VERSION_KEY, time.time_ns(), timeout=None)
+        version = cache.get(VERSION_KEY)
+    return version
+
+
+def bump_version():
+    cache = get_cache()
+    try:
+        cache.incr(VERSION_KEY)
+    except ValueError:
+        cache.set(VERSION_KEY, time.time_ns(), timeout=None)
+
+
+def invalidate_books():
+    # Bumping again after commit drops anything a concurrent request cached
+    # from the pre-commit state while the transaction was open.
+    bump_version()
+    transaction.on_commit(bump_version)
+
+
+def count(key):
+    cache = get_cache()
+    if not cache.add(key, 1, timeout=None):
+        try:
+            cache.incr(key)
+        except ValueError:
+            cache.set(key, 1, timeout=None)
+
+
+def request_fingerprint(request):
+    params = sorted((key, value) for key, values in request.query_params.lists() for value in values)
+    raw = f'{request.build_absolute_uri(request.path)}|{params}'
+    return hashlib.md5(raw.encode()).hexdigest()
+
+
+def response_key(request):
+    if not settings.STORE_CACHE_TIMEOUT or not cache_shared():
+        return None
+    return f'books:{get_version()}:{request_fingerprint(request)}'
+
+
+def list_etag(request):
+    # A version only some workers have seen would keep answering 304 for a
+    # list that changed, so without a shared cache there is no list ETag.
+    if not cache_shared():
+        return None
+    return f'"books-{get_version()}-{request_fingerprint(request)}"'
+
+
+def get_response(key):
+    data = get_cache().get(key)
+    count(MISSES_KEY if data is None else HITS_KEY)
+    return data
+
+
+def set_response(key, data):
+    get_cache().set(key, data, timeout=settings.STORE_CACHE_TIMEOUT)
+
+
+def cache_stats():
+    cache = get_cache()
+    hits = cache.get(HITS_KEY, 0)
+    misses = cache.get(MISSES_KEY, 0)
+    return {
+        'hits': hits,
+        'misses': misses,
+        'hit_ratio': round(hits / (hits + misses), 4) if hits + misses else None,
+        'version': get_version(),
+    }
@@ -0,0 +1,122 @@
+import csv
+import io
+import json
+import time
+from itertools import islice
+
+from django.db import connections, router, transaction
+
+from store.cache import invalidate_books
+from store.models import Book
+from store.serializers import BookImportSerializer
+
+FORMATS = ('csv', 'jsonl')
+EXPORT_FIELDS = ('id', 'name', 'price', 'author_name', 'discount')
+
+
+class BookImportError(Exception):
+    def __init__(self, row, errors):
+        super().__init__(f'Row {row}: {errors}')
+        self.row = row
+        self.errors = errors
+
+
+def guess_format(filename):
+    extension = filename.rsplit('.', 1)[-1].lower() if '.' in filename else ''
+    return {'csv': 'csv', 'jsonl': 'jsonl', 'ndjson': 'jsonl'}.get(extension)
+
+
+def read_rows(stream, file_format):
+    if file_format == 'csv':
+        for row in csv.DictReader(stream):
+            yield {key: value for key, value in row.items() if value != ''}
+        return
+
+    for number, line in enumerate(stream, 1):
+        if not line.strip():
+            continue
+        try:
+            row = json.loads(line)
+        except ValueError as error:
+            raise BookImportError(number, str(error))
+        if not isinstance(row, dict):
+            raise BookImportError(number, 'Expected a JSON object.')
+        yield row
+
+
+def import_books(stream, file_format, owner=None, chunk_size=1000):
+    using = router.db_for_write(Book)
+    rows = read_rows(stream, file_format)
+    started = time.perf_counter()
+    total = 0
+
+    with transaction.atomic(using=using):
+        while True:
+            chunk = list(islice(rows, chunk_size))
+            if not chunk:
+                break
+
+            serializer = BookImportSerializer(data=chunk, many=True)
+            if not serializer.is_valid():
+                position, errors = next((i, errors) for i, errors in enumerate(serializer.errors) if errors)
+                raise BookImportError(total + position + 1, errors)
+
+            write_books([Book(owner=owner, **data) for data in serializer.validated_data], using)
+            total += len(chunk)
+
+        invalidate_books()
+
+    return total, time.perf_counter() - started
+
+
+def write_books(books, using):
+    # bulk_create and COPY both skip Book.save().
+    for book in books:
+        book.set_discounted_price()
+
+    connection = connections[using]
+    if connection.vendor != 'postgresql':
+        Book.objects.using(using).bulk_create(books)
+        return
+
+    fields = [field for field in Book._meta.concrete_fields if not field.primary_key]
+    buffer = io.StringIO()
+    # Quoting every string keeps empty strings apart from NULL, which COPY
+    # reads from an unquoted empty field.
+    writer = csv.writer(buffer, quoting=csv.QUOTE_NONNUMERIC)
+    for book in books:
+        writer.writerow([field.get_db_prep_save(field.pre_save(book, True), connection) for field in fields])
+    buffer.seek(0)
+
+    table = connection.ops.quote_name(Book._meta.db_table)
+    columns = ', '.join(connection.ops.quote_name(field.column) for field in fields)
+    with connection.cursor() as cursor:
+        cursor.copy_expert(f'COPY {table} ({columns}) FROM STDIN WITH (FORMAT csv)', buffer)
+
+
+def export_books(queryset, file_format, chunk_size=1000):
+    rows = queryset.order_by('pk').values_list(*EXPORT_FIELDS).iterator(chunk_size=chunk_size)
+    buffer = io.StringIO()
+
+    if file_format == 'csv':
+        writer = csv.writer(buffer)
+        writer.writerow(EXPORT_FIELDS)
+        write = writer.writerow
+    else:
+        def write(row):
+            values = dict(zip(EXPORT_FIELDS, row))
+            values['price'] = str(values['price'])
+            buffer.write(json.dumps(values, ensure_ascii=False) + '\n')
+
+    while True:
+        chunk = list(islice(rows, chunk_size))
+        if not chunk:
+            break
+        for row in chunk:
+            write(row)
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+
+    if buffer.tell():
+        yield buffer.getvalue()
@@ -0,0 +1,178 @@
+import logging
+import threading
+import time
+from collections import defaultdict
+from contextlib import ExitStack
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+
+from django.conf import settings
+from django.db import connections
+from django.http import HttpResponse, HttpResponseForbidden
+from django.utils.crypto import constant_time_compare
+
+logger = logging.getLogger(__name__)
+
+METRICS = (
+    ('requests_total', 'counter', 'Requests served.'),
+    ('queries_total', 'counter', 'Database queries executed.'),
+    ('sql_seconds_total', 'counter', 'Time spent executing SQL.'),
+    ('app_seconds_total', 'counter', 'View time outside SQL, including serializers.'),
+    ('render_seconds_total', 'counter', 'Time spent rendering response bodies.'),
+    ('response_bytes_total', 'counter', 'Response body bytes, streaming responses excluded.'),
+    ('budget_exceeded_total', 'counter', 'Requests that went over their route budget.'),
+)
+
+
+class BudgetExceeded(Exception):
+    pass
+
+
+class Registry:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.routes = defaultdict(lambda: dict.fromkeys((name for name, _, _ in METRICS), 0))
+
+    def record(self, labels, **values):
+        with self.lock:
+            totals = self.routes[labels]
+            for name, value in values.items():
+                totals[name] += value
+
+    def clear(self):
+        with self.lock:
+            self.routes.clear()
+
+    def render(self):
+        with self.lock:
+            routes = {route: dict(totals) for route, totals in self.routes.items()}
+
+        lines = []
+        for name, kind, description in METRICS:
+            lines.append(f'# HELP bookstore_{name} {description}')
+            lines.append(f'# TYPE bookstore_{name} {kind}')
+            for (route, method), totals in sorted(routes.items()):
+                lines.append(f'bookstore_{name}{{route="{route}",method="{method}"}} {totals[name]:g}')
+        return '\n'.join(lines) + '\n'
+
+
+registry = Registry()
+
+
+class RequestStats:
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.queries = 0
+        self.sql = 0.0
+        self.view_started = self.view_finished = self.rendered = None
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.sql += time.perf_counter() - started
+            self.queries += 1
+
+
+class InstrumentationMiddleware:
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+
+        stats = request.store_stats = RequestStats()
+        with self.wrap_connections(stats):
+            response = self.get_response(request)
+
+        self.finish(request, response, stats)
+        return response
+
+    async def __acall__(self, request):
+        stats = request.store_stats = RequestStats()
+        with self.wrap_connections(stats):
+            response = await self.get_response(request)
+
+        self.finish(request, response, stats)
+        return response
+
+    def wrap_connections(self, stats):
+        stack = ExitStack()
+        for connection in connections.all():
+            stack.enter_context(connection.execute_wrapper(stats))
+        return stack
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        request.store_stats.view_started = time.perf_counter()
+
+    def process_template_response(self, request, response):
+        stats = request.store_stats
+        stats.view_finished = time.perf_counter()
+        response.add_post_render_callback(lambda rendered: setattr(stats, 'rendered', time.perf_counter()))
+        return response
+
+    def finish(self, request, response, stats):
+        finished = time.perf_counter()
+        total = finished - stats.started
+        view = (stats.view_finished or finished) - (stats.view_started or stats.started)
+        render = stats.rendered - stats.view_finished if stats.rendered and stats.view_finished else 0.0
+        app = max(view - stats.sql, 0.0)
+        size = 0 if response.streaming else len(response.content)
+
+        match = getattr(request, 'resolver_match', None)
+        route = match.view_name if match else 'unresolved'
+
+        if settings.STORE_SERVER_TIMING:
+            response['Server-Timing'] = ', '.join([
+                f'db;dur={stats.sql * 1000:.2f};desc="{stats.queries} queries"',
+                f'app;dur={app * 1000:.2f}',
+                f'render;dur={render * 1000:.2f}',
+                f'total;dur={total * 1000:.2f}',
+            ])
+
+        measured = {'queries': stats.queries, 'sql_ms': stats.sql * 1000, 'bytes': size}
+        exceeded = over_budget(route, request.method, measured)
+        registry.record(
+            (route, request.method),
+            requests_total=1,
+            queries_total=stats.queries,
+            sql_seconds_total=stats.sql,
+            app_seconds_total=app,
+            render_seconds_total=render,
+            response_bytes_total=size,
+            budget_exceeded_total=int(bool(exceeded)),
+        )
+
+        if exceeded:
+            message = f'{request.method} {route} went over its budget: ' + ', '.join(exceeded)
+            if settings.STORE_BUDGET_ACTION == 'raise':
+                raise BudgetExceeded(message)
+            logger.warning(message)
+
+
+def over_budget(route, method, measured):
+    budgets = settings.STORE_ROUTE_BUDGETS
+    budget = budgets.get(f'{method} {route}', budgets.get(route, {}))
+    return [
+        f'{name} {measured[name]:g} > {limit:g}'
+        for name, limit in budget.items() if measured[name] > limit
+    ]
+
+
+def metrics_token_valid(request):
+    token = settings.STORE_METRICS_TOKEN
+    authorization = request.META.get('HTTP_AUTHORIZATION', '')
+    return bool(token) and constant_time_compare(authorization, f'Bearer {token}')
+
+
+def metrics(request):
+    if not request.user.is_staff and not metrics_token_valid(request):
+        return HttpResponseForbidden()
+    return HttpResponse(registry.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
@@ -0,0 +1,174 @@
+import json
+import threading
+import time
+import tracemalloc
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management.base import BaseCommand, CommandError
+from django.test import Client, override_settings
+from django.urls import reverse
+
+from store.benchmarks import summarize
+from store.models import Book, UserBookRelation
+
+# Books and users the write routes create are named with this prefix and
+# deleted when the run ends.
+THROWAWAY = 'bench-throwaway'
+
+
+class Command(BaseCommand):
+    help = (
+        'Run every BookViewSet and UserBookRelationView route through the test client, single-threaded and '
+        'concurrently, and print latency percentiles, queries per request and peak traced memory as JSON. '
+        'Memory is measured in a separate pass, since tracemalloc slows the timed ones down. The response cache '
+        'and route budgets are disabled. Create, update, destroy and import only touch throwaway books, which '
+        'are deleted at the end, and cache-stats is requested by a throwaway staff user.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=50, help='Requests per route and mode.')
+        parser.add_argument('--concurrency', type=int, default=8)
+        parser.add_argument('--only', default='', help='Only run routes whose name contains this text.')
+
+    def handle(self, *args, **options):
+        relation = UserBookRelation.objects.order_by('pk').values('user_id', 'book_id').first()
+        if relation is None:
+            raise CommandError('Nothing to benchmark, seed some data first (seed_bookstore).')
+
+        dataset = {'books': Book.objects.count(), 'relations': UserBookRelation.objects.count()}
+        self.user = User.objects.get(pk=relation['user_id'])
+        staff, _ = User.objects.get_or_create(username=f'{THROWAWAY}-staff', defaults={'is_staff': True})
+        try:
+            self.bench(relation['book_id'], staff, dataset, options)
+        finally:
+            Book.objects.filter(name__startswith=THROWAWAY).delete()
+            staff.delete()
+
+    def bench(self, book_id, staff, dataset, options):
+        # Every thread's client shares one session per user, so logging in
+        # does not write a session row per thread.
+        self.cookies = {}
+        for is_staff, user in ((False, self.user), (True, staff)):
+            login = Client()
+            login.force_login(user)
+            self.cookies[is_staff] = login.cookies
+        self.local = threading.local()
+        routes = [route for route in self.get_routes(book_id) if options['only'] in route[0]]
+
+        overrides = {
+            'STORE_CACHE_TIMEOUT': 0,
+            'STORE_ROUTE_BUDGETS': {},
+            'ALLOWED_HOSTS': [*settings.ALLOWED_HOSTS, 'testserver'],
+        }
+        results = {'dataset': dataset, 'routes': {}}
+        # A single pool keeps one client and one connection per thread for the whole run.
+        with override_settings(**overrides), ThreadPoolExecutor(options['concurrency']) as self.pool:
+            for route in routes:
+                results['routes'][route[0]] = {
+                    'single': self.run(route, options['requests'], 1),
+                    'concurrent': self.run(route, options['requests'], options['concurrency']),
+                    'peak_memory_kb': self.peak_memory(route, min(options['requests'], 5)),
+                }
+
+        self.stdout.write(json.dumps(results, indent=2))
+
+    def get_routes(self, book_id):
+        book = Book.objects.values('name', 'price').get(pk=book_id)
+        book_ids = list(Book.objects.order_by('pk').values_list('pk', flat=True)[:20])
+        items = [{'book': pk, 'like': True} for pk in book_ids]
+        edited = self.throwaway_book()
+        fields = {'name': f'{THROWAWAY} edited', 'price': '12.00', 'author_name': 'Bench'}
+        catalog = ''.join(f'{THROWAWAY} imported {index},10,Bench\n' for index in range(20))
+
+        # A path or data given as a callable is built anew, untimed, for every
+        # request, so a destroyed book or a consumed upload is never reused.
+        return [
+            ('GET book-list', 'get', reverse('book-list'), {}),
+            ('GET book-list ?ordering=-price', 'get', reverse('book-list'), {'ordering': '-price'}),
+            ('GET book-list ?price=', 'get', reverse('book-list'), {'price': book['price']}),
+            ('GET book-list ?search=', 'get', reverse('book-list'), {'search': book['name'].split()[-1]}),
+            ('GET book-list ?stream=1', 'get', reverse('book-list'), {'stream': 1}),
+            ('POST book-list', 'post', reverse('book-list'), fields),
+            ('GET book-detail', 'get', reverse('book-detail', args=(book_id,)), {}),
+            ('PUT book-detail', 'put', reverse('book-detail', args=(edited,)), fields),
+            ('PATCH book-detail', 'patch', reverse('book-detail', args=(edited,)), {'price': '13.00'}),
+            ('DELETE book-detail', 'delete', lambda: reverse('book-detail', args=(self.throwaway_book(),)), {}),
+            ('GET book-readers', 'get', reverse('book-readers', args=(book_id,)), {}),
+            ('GET book-similar', 'get', reverse('book-similar', args=(book_id,)), {}),
+            ('GET book-suggest', 'get', reverse('book-suggest'), {'q': book['name'][:6]}),
+            ('GET book-leaderboard', 'get', reverse('book-leaderboard', args=('top-rated',)), {}),
+            ('GET book-cache-stats', 'get', reverse('book-cache-stats'), {}),
+            ('POST book-import', 'upload', reverse('book-import'), lambda: {
+                'file': SimpleUploadedFile('books.csv', f'name,price,author_name\n{catalog}'.encode()),
+            }),
+            ('GET book-export', 'get', reverse('book-export'), {}),
+            ('GET userbookrelation-list', 'get', reverse('userbookrelation-list'), {
+                'books': ','.join(map(str, book_ids)),
+            }),
+            ('GET userbookrelation-changes', 'get', reverse('userbookrelation-changes'), {}),
+            ('PATCH userbookrelation-detail', 'patch', reverse('userbookrelation-detail', args=(book_id,)), {
+                'like': True,
+            }),
+            ('POST userbookrelation-bulk', 'post', reverse('userbookrelation-bulk'), items),
+        ]
+
+    def throwaway_book(self):
+        return Book.objects.create(name=THROWAWAY, price=10, author_name='Bench', owner=self.user).pk
+
+    def get_client(self, staff):
+        clients = getattr(self.local, 'clients', None)
+        if clients is None:
+            clients = self.local.clients = {}
+        if staff not in clients:
+            # Server errors, such as SQLite lock timeouts under concurrent
+            # writes, are counted as failed requests instead of aborting the run.
+            clients[staff] = Client(raise_request_exception=False)
+            clients[staff].cookies.update(self.cookies[staff])
+        return clients[staff]
+
+    def request(self, route):
+        name, method, path, data = route
+        path = path() if callable(path) else path
+        data = data() if callable(data) else data
+        client = self.get_client(staff=name == 'GET book-cache-stats')
+
+        started = time.perf_counter()
+        if method == 'get':
+            response = client.get(path, data)
+        elif method == 'upload':
+            response = client.post(path, data)
+        else:
+            response = getattr(client, method)(path, json.dumps(data), content_type='application/json')
+        if response.streaming:
+            b''.join(response.streaming_content)
+        elapsed = time.perf_counter() - started
+        return elapsed, response.status_code < 400, response.wsgi_request.store_stats.queries
+
+    def run(self, route, count, concurrency):
+        # Warm-up requests open the connections and fill per-connection
+        # caches before anything is timed.
+        if concurrency == 1:
+            self.request(route)
+            started = time.perf_counter()
+            timings = [self.request(route) for _ in range(count)]
+        else:
+            list(self.pool.map(lambda _: self.request(route), range(concurrency)))
+            started = time.perf_counter()
+            timings = list(self.pool.map(lambda _: self.request(route), range(count)))
+        elapsed = time.perf_counter() - started
+
+        result = summarize([(latency, ok) for latency, ok, _ in timings], elapsed, concurrency)
+        result['queries_per_request'] = round(sum(queries for _, _, queries in timings) / len(timings), 2)
+        return result
+
+    def peak_memory(self, route, count):
+        tracemalloc.start()
+        try:
+            for _ in range(count):
+                self.request(route)
+            return round(tracemalloc.get_traced_memory()[1] / 1024, 1)
+        finally:
+            tracemalloc.stop()
@@ -0,0 +1,43 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from rest_framework.renderers import JSONRenderer
+
+from store.serializers import BookFastSerializer, BookSerializer
+from store.views import BookViewSet, top_readers_prefetch
+
+
+class Command(BaseCommand):
+    help = (
+        'Compare rows per second of BookSerializer and BookFastSerializer on the first books of the list query, '
+        'after checking that both render the same JSON bytes.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--limit', type=int, default=1000)
+        parser.add_argument('--repeat', type=int, default=5)
+
+    def handle(self, *args, **options):
+        queryset = BookViewSet.queryset.prefetch_related(top_readers_prefetch(settings.STORE_TOP_READERS))
+        books = list(queryset[:options['limit']])
+        if not books:
+            raise CommandError('Nothing to serialize, seed some books first (seed_bookstore).')
+
+        renderer = JSONRenderer()
+        if renderer.render(BookSerializer(books, many=True).data) != renderer.render(
+            BookFastSerializer(books, many=True).data
+        ):
+            raise CommandError('BookFastSerializer output differs from BookSerializer.')
+
+        rates = {}
+        for serializer_class in (BookSerializer, BookFastSerializer):
+            started = time.perf_counter()
+            for _ in range(options['repeat']):
+                serializer_class(books, many=True).data
+            elapsed = time.perf_counter() - started
+            rates[serializer_class] = len(books) * options['repeat'] / elapsed
+            self.stdout.write(f'{serializer_class.__name__}: {rates[serializer_class]:.0f} rows/s')
+
+        speedup = rates[BookFastSerializer] / rates[BookSerializer]
+        self.stdout.write(self.style.SUCCESS(f'{len(books)} books, {speedup:.1f}x faster'))
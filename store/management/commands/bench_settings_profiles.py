@@ -0,0 +1,69 @@
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.test import Client
+
+PROFILES = ('dev', 'prod')
+STARTUP = 'import django; django.setup(); import bookstore.urls'
+
+
+class Command(BaseCommand):
+    help = (
+        'Compare settings profiles: process startup time (django.setup() plus URL import) '
+        'and per request overhead of the middleware stack on a view that does not touch the database.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--profiles', nargs='+', default=PROFILES, choices=PROFILES)
+        parser.add_argument('--starts', type=int, default=5)
+        parser.add_argument('--requests', type=int, default=500)
+        parser.add_argument('--child', action='store_true', help='Measure requests in this process only.')
+
+    def handle(self, *args, **options):
+        if options['child']:
+            self.stdout.write(json.dumps(self.measure_requests(options['requests'])))
+            return
+
+        results = {}
+        for profile in options['profiles']:
+            env = {**os.environ, 'DJANGO_PROFILE': profile, 'ALLOWED_HOSTS': 'testserver'}
+            starts = []
+            for _ in range(options['starts']):
+                started = time.perf_counter()
+                subprocess.run([sys.executable, '-c', STARTUP], env=env, cwd=settings.BASE_DIR, check=True)
+                starts.append((time.perf_counter() - started) * 1000)
+
+            child = subprocess.run(
+                [
+                    sys.executable, str(settings.BASE_DIR / 'manage.py'), 'bench_settings_profiles',
+                    '--child', '--requests', str(options['requests']),
+                ],
+                env=env, cwd=settings.BASE_DIR, check=True, capture_output=True, text=True,
+            )
+            results[profile] = {'startup_ms': round(statistics.median(starts), 1), **json.loads(child.stdout)}
+
+        self.stdout.write(json.dumps(results, indent=2))
+
+    def measure_requests(self, count):
+        client = Client()
+        url = '/book/suggest/'
+        client.get(url)
+
+        timings = []
+        for _ in range(count):
+            started = time.perf_counter()
+            client.get(url)
+            timings.append((time.perf_counter() - started) * 1_000_000)
+
+        return {
+            'debug': settings.DEBUG,
+            'middleware': len(settings.MIDDLEWARE),
+            'request_us_median': round(statistics.median(timings), 1),
+            'request_us_p95': round(statistics.quantiles(timings, n=20)[-1], 1),
+        }
@@ -0,0 +1,110 @@
+import asyncio
+import io
+import json
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.handlers.asgi import ASGIHandler
+from django.core.handlers.wsgi import WSGIHandler
+from django.core.management.base import BaseCommand
+from django.test import override_settings
+
+from store.benchmarks import summarize
+
+
+class Command(BaseCommand):
+    help = (
+        'Drive the WSGI and ASGI applications in process at a fixed concurrency and report throughput and '
+        'latency percentiles for the sync BookViewSet list and the async list view. The response cache and '
+        'route budgets are disabled so every request reaches the database.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=2000)
+        parser.add_argument('--concurrency', type=int, default=64)
+        parser.add_argument('--query', default='', help='Query string sent with every request, e.g. page_size=50.')
+        parser.add_argument('--sync-path', default='/book/')
+        parser.add_argument('--async-path', default='/async/book/')
+        parser.add_argument('--host', default='localhost', help='Host header, it must be in ALLOWED_HOSTS.')
+
+    def handle(self, *args, **options):
+        count, concurrency, query = options['requests'], options['concurrency'], options['query']
+        self.host = options['host']
+
+        with override_settings(STORE_CACHE_TIMEOUT=0, STORE_ROUTE_BUDGETS={}):
+            results = {
+                'wsgi, sync view': self.run_wsgi(options['sync_path'], query, count, concurrency),
+                'asgi, sync view': self.run_asgi(options['sync_path'], query, count, concurrency),
+                'asgi, async view': self.run_asgi(options['async_path'], query, count, concurrency),
+            }
+
+        self.stdout.write(json.dumps(results, indent=2))
+
+    def run_wsgi(self, path, query, count, concurrency):
+        application = WSGIHandler()
+
+        def request(_):
+            statuses = []
+            environ = {
+                'REQUEST_METHOD': 'GET',
+                'PATH_INFO': path,
+                'QUERY_STRING': query,
+                'SERVER_NAME': self.host,
+                'SERVER_PORT': '80',
+                'HTTP_HOST': self.host,
+                'wsgi.url_scheme': 'http',
+                'wsgi.input': io.BytesIO(),
+            }
+            started = time.perf_counter()
+            response = application(environ, lambda status, headers: statuses.append(status))
+            b''.join(response)
+            response.close()
+            return time.perf_counter() - started, statuses[0].startswith('200')
+
+        started = time.perf_counter()
+        with ThreadPoolExecutor(concurrency) as pool:
+            timings = list(pool.map(request, range(count)))
+        return summarize(timings, time.perf_counter() - started, concurrency)
+
+    def run_asgi(self, path, query, count, concurrency):
+        application = ASGIHandler()
+
+        async def request(semaphore):
+            async with semaphore:
+                scope = {
+                    'type': 'http',
+                    'asgi': {'version': '3.0'},
+                    'http_version': '1.1',
+                    'method': 'GET',
+                    'scheme': 'http',
+                    'path': path,
+                    'raw_path': path.encode(),
+                    'query_string': query.encode(),
+                    'root_path': '',
+                    'headers': [(b'host', self.host.encode())],
+                    'client': ('127.0.0.1', 0),
+                    'server': (self.host, 80),
+                }
+                body_sent = asyncio.Event()
+                messages = []
+
+                async def receive():
+                    if not body_sent.is_set():
+                        body_sent.set()
+                        return {'type': 'http.request', 'body': b'', 'more_body': False}
+                    await asyncio.Event().wait()
+
+                async def send(message):
+                    messages.append(message)
+
+                started = time.perf_counter()
+                await application(scope, receive, send)
+                return time.perf_counter() - started, messages[0]['status'] == 200
+
+        async def run():
+            semaphore = asyncio.Semaphore(concurrency)
+            return await asyncio.gather(*(request(semaphore) for _ in range(count)))
+
+        started = time.perf_counter()
+        timings = asyncio.run(run())
+        return summarize(timings, time.perf_counter() - started, concurrency)
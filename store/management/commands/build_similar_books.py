@@ -0,0 +1,35 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from store.similarity import build_similarities
+
+
+class Command(BaseCommand):
+    help = (
+        'Build the "readers who liked this also liked" table: cosine similarity between books over likes, '
+        'bookmarks and good rates, keeping the top neighbours of every book. Needs numpy and scipy.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--top', type=int, default=None, help='Neighbours per book, STORE_SIMILAR_BOOKS by default.')
+        parser.add_argument('--chunk-size', type=int, default=100000, help='Relations read per query.')
+        parser.add_argument('--block-size', type=int, default=1000, help='Books scored per worker task.')
+        parser.add_argument('--workers', type=int, default=None, help='Worker processes, one per CPU by default.')
+
+    def handle(self, *args, **options):
+        try:
+            import numpy  # noqa: F401
+            import scipy  # noqa: F401
+        except ImportError:
+            raise CommandError('build_similar_books needs numpy and scipy, install them with pip.')
+
+        started = time.perf_counter()
+        total = build_similarities(
+            options['top'] or settings.STORE_SIMILAR_BOOKS,
+            chunk_size=options['chunk_size'],
+            block_size=options['block_size'],
+            workers=options['workers'],
+        )
+        self.stdout.write(self.style.SUCCESS(f'Stored {total} similar books in {time.perf_counter() - started:.1f}s'))
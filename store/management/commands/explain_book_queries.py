@@ -0,0 +1,98 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.db.models import Q
+
+from store.models import Book, UserBookRelation
+from store.seeding import seed_bookstore
+from store.views import BookViewSet, top_readers_prefetch
+
+INDEXES = [
+    'store_book_price_id_idx',
+    'store_book_author_id_idx',
+    'store_book_discounted_id_idx',
+    'store_relation_book_id_idx',
+    'store_relation_liked_idx',
+    'store_relation_bookmarked_idx',
+]
+
+
+class Command(BaseCommand):
+    help = (
+        'Print query plans and timings of the BookViewSet and UserBookRelationView query paths, '
+        'first with the supporting indexes dropped inside a rolled back transaction, then with them. '
+        'Dropping indexes locks the tables, so run it against a scratch database.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--seed', type=int, default=0, help='Create this many synthetic books first, see seed_bookstore.')
+        parser.add_argument('--repeat', type=int, default=20)
+
+    def handle(self, *args, **options):
+        if options['seed']:
+            self.seed(options['seed'])
+
+        fields = ('id', 'price', 'author_name', 'discounted_price')
+        book = Book.objects.order_by('pk').values(*fields)[Book.objects.count() // 2:].first()
+        relation = UserBookRelation.objects.order_by('pk').values('user_id', 'book_id').first()
+        if book is None or relation is None:
+            raise CommandError('Nothing to explain, seed some books and relations first (--seed).')
+
+        for label, drop_indexes in (('Without indexes', True), ('With indexes', False)):
+            self.stdout.write(self.style.MIGRATE_HEADING(label))
+
+            with transaction.atomic():
+                if drop_indexes:
+                    with connection.cursor() as cursor:
+                        for name in INDEXES:
+                            cursor.execute(f'DROP INDEX {connection.ops.quote_name(name)}')
+
+                for name, queryset in self.get_queries(book, relation):
+                    elapsed = self.measure(queryset, options['repeat'])
+                    self.stdout.write(self.style.SUCCESS(f'{name}: {elapsed:.3f} ms'))
+                    self.stdout.write(self.explain(queryset))
+
+                transaction.set_rollback(True)
+
+    def get_queries(self, book, relation):
+        books = BookViewSet.queryset
+        page_ids = list(Book.objects.order_by('pk').values_list('pk', flat=True)[:20])
+        readers = top_readers_prefetch(10).queryset
+
+        return [
+            ('list', books.order_by('id')[:21]),
+            ('list ?price=', books.filter(price=book['price']).order_by('id')[:21]),
+            ('list ?ordering=price next page', books.filter(
+                Q(price__gt=book['price']) | Q(price=book['price'], id__gt=book['id'])
+            ).order_by('price', 'id')[:21]),
+            ('list ?ordering=discounted_price next page', books.filter(
+                Q(discounted_price__gt=book['discounted_price'])
+                | Q(discounted_price=book['discounted_price'], id__gt=book['id'])
+            ).order_by('discounted_price', 'id')[:21]),
+            ('list ?ordering=-author_name next page', books.filter(
+                Q(author_name__lt=book['author_name']) | Q(author_name=book['author_name'], id__lt=book['id'])
+            ).order_by('-author_name', '-id')[:21]),
+            ('top readers prefetch', readers.filter(book_id__in=page_ids)),
+            ('relation lookup', UserBookRelation.objects.filter(
+                user_id=relation['user_id'], book_id=relation['book_id']
+            )),
+            ('book likes', UserBookRelation.objects.filter(book_id=relation['book_id'], like=True).values('id')),
+            ('user bookmarks', UserBookRelation.objects.filter(user_id=relation['user_id'], in_bookmarks=True)),
+        ]
+
+    def explain(self, queryset):
+        sql, params = queryset.query.sql_with_params()
+        with connection.cursor() as cursor:
+            cursor.execute(f'{connection.ops.explain_query_prefix()} {sql}', params)
+            return '\n'.join(' '.join(str(column) for column in row) for row in cursor.fetchall())
+
+    def measure(self, queryset, repeat):
+        started = time.perf_counter()
+        for _ in range(repeat):
+            list(queryset.all())
+        return (time.perf_counter() - started) * 1000 / repeat
+
+    def seed(self, count):
+        books, users, relations = seed_bookstore(books=count, users=max(count // 10, 1), relations=count * 2)
+        self.stdout.write(f'Seeded {books} books, {users} users and {relations} relations')
@@ -0,0 +1,35 @@
+import sys
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from store.importexport import FORMATS, export_books, guess_format
+from store.models import Book
+
+
+class Command(BaseCommand):
+    help = 'Export every book to a CSV or JSON Lines file ("-" writes stdout) without loading the catalog in memory.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path')
+        parser.add_argument('--format', dest='file_format', choices=FORMATS)
+        parser.add_argument('--chunk-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        path = options['path']
+        file_format = options['file_format'] or guess_format(path)
+        if file_format is None:
+            raise CommandError('Cannot tell the file format from the path, pass --format.')
+
+        started = time.perf_counter()
+        total = Book.objects.count()
+        stream = sys.stdout if path == '-' else open(path, 'w', newline='', encoding='utf-8')
+        try:
+            stream.writelines(export_books(Book.objects.all(), file_format, options['chunk_size']))
+        finally:
+            if stream is not sys.stdout:
+                stream.close()
+
+        elapsed = time.perf_counter() - started
+        rate = total / elapsed if elapsed else 0
+        self.stderr.write(f'Exported {total} books in {elapsed:.2f} s ({rate:.0f} rows/s)')
@@ -0,0 +1,29 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from store.utils import flush_dirty_books
+
+
+class Command(BaseCommand):
+    help = 'Recompute counters and ratings for books queued while STORE_DEFERRED_COUNTERS is enabled.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000)
+        parser.add_argument('--loop', action='store_true', help='Keep polling the queue instead of exiting once empty.')
+        parser.add_argument('--interval', type=float, default=1.0)
+
+    def handle(self, *args, **options):
+        total = 0
+
+        while True:
+            flushed = flush_dirty_books(options['batch_size'])
+            total += flushed
+
+            if flushed:
+                continue
+            if not options['loop']:
+                break
+            time.sleep(options['interval'])
+
+        self.stdout.write(self.style.SUCCESS(f'Flushed {total} books'))
@@ -0,0 +1,41 @@
+import sys
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+
+from store.importexport import FORMATS, BookImportError, guess_format, import_books
+
+
+class Command(BaseCommand):
+    help = 'Import books from a CSV or JSON Lines file ("-" reads stdin) in chunks, in a single transaction.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path')
+        parser.add_argument('--format', dest='file_format', choices=FORMATS)
+        parser.add_argument('--owner', help='Username to set as the owner of the imported books.')
+        parser.add_argument('--chunk-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        path = options['path']
+        file_format = options['file_format'] or guess_format(path)
+        if file_format is None:
+            raise CommandError('Cannot tell the file format from the path, pass --format.')
+
+        owner = None
+        if options['owner']:
+            try:
+                owner = User.objects.get(username=options['owner'])
+            except User.DoesNotExist:
+                raise CommandError(f'User "{options["owner"]}" does not exist.')
+
+        stream = sys.stdin if path == '-' else open(path, newline='', encoding='utf-8-sig')
+        try:
+            total, elapsed = import_books(stream, file_format, owner, options['chunk_size'])
+        except BookImportError as error:
+            raise CommandError(str(error))
+        finally:
+            if stream is not sys.stdin:
+                stream.close()
+
+        rate = total / elapsed if elapsed else 0
+        self.stdout.write(self.style.SUCCESS(f'Imported {total} books in {elapsed:.2f} s ({rate:.0f} rows/s)'))
@@ -0,0 +1,28 @@
+from django.core.management.base import BaseCommand
+
+from store.models import Book
+from store.utils import refresh_book_counters
+
+
+class Command(BaseCommand):
+    help = 'Recompute the denormalized reader, like, bookmark and rating counters of every book.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        chunk_size = options['chunk_size']
+        last_id = 0
+        total = 0
+
+        while True:
+            book_ids = list(
+                Book.objects.filter(pk__gt=last_id).order_by('pk').values_list('pk', flat=True)[:chunk_size]
+            )
+            if not book_ids:
+                break
+
+            total += refresh_book_counters(book_ids)
+            last_id = book_ids[-1]
+
+        self.stdout.write(self.style.SUCCESS(f'Rebuilt counters for {total} books'))
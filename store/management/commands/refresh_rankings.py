@@ -0,0 +1,27 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from store.rankings import rankings_stale, refresh_rankings
+
+
+class Command(BaseCommand):
+    help = (
+        'Recompute the top-rated, most-liked and most-bookmarked leaderboards. With --loop the command keeps '
+        'running and only recomputes when a book changed since the last refresh.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--size', type=int, default=None, help='Books kept per board, STORE_RANKING_SIZE by default.')
+        parser.add_argument('--loop', action='store_true')
+        parser.add_argument('--interval', type=float, default=60.0)
+
+    def handle(self, *args, **options):
+        while True:
+            if not options['loop'] or rankings_stale():
+                total = refresh_rankings(options['size'])
+                self.stdout.write(self.style.SUCCESS(f'Ranked {total} books'))
+
+            if not options['loop']:
+                break
+            time.sleep(options['interval'])
@@ -0,0 +1,30 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from store.seeding import seed_bookstore
+
+
+class Command(BaseCommand):
+    help = (
+        'Bulk create a synthetic catalog: Zipfian book popularity and reader activity, a J-shaped rating '
+        'distribution and likes that follow good rates. Counters and ratings are filled in as well.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--books', type=int, default=10000)
+        parser.add_argument('--users', type=int, default=1000)
+        parser.add_argument('--relations', type=int, default=50000)
+        parser.add_argument('--seed', type=int, default=0, help='Random seed, the same seed gives the same data.')
+        parser.add_argument('--exponent', type=float, default=1.1, help='Zipf exponent of book popularity.')
+        parser.add_argument('--batch-size', type=int, default=5000)
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        books, users, relations = seed_bookstore(
+            options['books'], options['users'], options['relations'],
+            seed=options['seed'], exponent=options['exponent'], batch_size=options['batch_size'],
+        )
+        self.stdout.write(self.style.SUCCESS(
+            f'Seeded {books} books, {users} users and {relations} relations in {time.perf_counter() - started:.1f}s'
+        ))
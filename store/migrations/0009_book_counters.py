@@ -0,0 +1,56 @@
+# Generated by Django 4.2.15 on 2026-10-18 04:52
+
+from django.db import migrations, models
+from django.db.models import Count, Q, Sum
+
+
+def fill_counters(apps, schema_editor):
+    Book = apps.get_model('store', 'Book')
+    UserBookRelation = apps.get_model('store', 'UserBookRelation')
+
+    rows = UserBookRelation.objects.values('book_id').annotate(
+        readers_count=Count('id'),
+        likes_count=Count('id', filter=Q(like=True)),
+        bookmarks_count=Count('id', filter=Q(in_bookmarks=True)),
+        rating_count=Count('rate'),
+        rating_sum=Sum('rate', default=0),
+    ).order_by()
+
+    for row in rows.iterator():
+        Book.objects.filter(pk=row.pop('book_id')).update(**row)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('store', '0008_book_rating'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='book',
+            name='bookmarks_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='book',
+            name='likes_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='book',
+            name='rating_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='book',
+            name='rating_sum',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='book',
+            name='readers_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.RunPython(fill_counters, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,21 @@
+# Generated by Django 4.2.15 on 2026-10-18 04:54
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('store', '0009_book_counters'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DirtyBook',
+            fields=[
+                ('book', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, serialize=False, to='store.book')),
+                ('marked_at', models.DateTimeField(auto_now=True, db_index=True)),
+            ],
+        ),
+    ]
@@ -0,0 +1,62 @@
+from django.db import migrations
+
+POSTGRESQL_CREATE = [
+    "CREATE INDEX IF NOT EXISTS store_book_search_idx ON store_book "
+    "USING gin (to_tsvector('simple', name || ' ' || author_name))",
+]
+
+POSTGRESQL_DROP = [
+    'DROP INDEX IF EXISTS store_book_search_idx',
+]
+
+SQLITE_CREATE = [
+    "CREATE VIRTUAL TABLE IF NOT EXISTS store_book_fts USING fts5("
+    "name, author_name, content='store_book', content_rowid='id')",
+    "INSERT INTO store_book_fts(store_book_fts) VALUES ('rebuild')",
+    "CREATE TRIGGER IF NOT EXISTS store_book_fts_insert AFTER INSERT ON store_book BEGIN "
+    "INSERT INTO store_book_fts(rowid, name, author_name) VALUES (new.id, new.name, new.author_name); "
+    "END",
+    "CREATE TRIGGER IF NOT EXISTS store_book_fts_delete AFTER DELETE ON store_book BEGIN "
+    "INSERT INTO store_book_fts(store_book_fts, rowid, name, author_name) "
+    "VALUES ('delete', old.id, old.name, old.author_name); "
+    "END",
+    "CREATE TRIGGER IF NOT EXISTS store_book_fts_update AFTER UPDATE OF name, author_name ON store_book BEGIN "
+    "INSERT INTO store_book_fts(store_book_fts, rowid, name, author_name) "
+    "VALUES ('delete', old.id, old.name, old.author_name); "
+    "INSERT INTO store_book_fts(rowid, name, author_name) VALUES (new.id, new.name, new.author_name); "
+    "END",
+]
+
+SQLITE_DROP = [
+    'DROP TRIGGER IF EXISTS store_book_fts_insert',
+    'DROP TRIGGER IF EXISTS store_book_fts_delete',
+    'DROP TRIGGER IF EXISTS store_book_fts_update',
+    'DROP TABLE IF EXISTS store_book_fts',
+]
+
+
+def create_search_index(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    statements = {'postgresql': POSTGRESQL_CREATE, 'sqlite': SQLITE_CREATE}.get(vendor, [])
+
+    for statement in statements:
+        schema_editor.execute(statement)
+
+
+def drop_search_index(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    statements = {'postgresql': POSTGRESQL_DROP, 'sqlite': SQLITE_DROP}.get(vendor, [])
+
+    for statement in statements:
+        schema_editor.execute(statement)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('store', '0010_dirtybook'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
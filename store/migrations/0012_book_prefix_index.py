@@ -0,0 +1,54 @@
+from django.db import migrations
+
+# Django compiles istartswith to UPPER(col::text) LIKE UPPER(...) on PostgreSQL
+# and to a case-insensitive LIKE on SQLite, which these indexes serve. A btree
+# in the C collation answers a LIKE prefix with a range scan and, unlike the
+# pattern operator classes, also returns the rows in the order suggest_books
+# asks for, so its LIMIT stops after the first matches.
+POSTGRESQL_CREATE = [
+    'CREATE INDEX IF NOT EXISTS store_book_name_upper_idx ON store_book ((UPPER(name::text)) COLLATE "C", id)',
+    'CREATE INDEX IF NOT EXISTS store_book_author_upper_idx ON store_book '
+    '((UPPER(author_name::text)) COLLATE "C", id)',
+]
+
+POSTGRESQL_DROP = [
+    'DROP INDEX IF EXISTS store_book_name_upper_idx',
+    'DROP INDEX IF EXISTS store_book_author_upper_idx',
+]
+
+SQLITE_CREATE = [
+    'CREATE INDEX IF NOT EXISTS store_book_name_nocase_idx ON store_book (name COLLATE NOCASE)',
+    'CREATE INDEX IF NOT EXISTS store_book_author_name_nocase_idx ON store_book (author_name COLLATE NOCASE)',
+]
+
+SQLITE_DROP = [
+    'DROP INDEX IF EXISTS store_book_name_nocase_idx',
+    'DROP INDEX IF EXISTS store_book_author_name_nocase_idx',
+]
+
+
+def create_prefix_index(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    statements = {'postgresql': POSTGRESQL_CREATE, 'sqlite': SQLITE_CREATE}.get(vendor, [])
+
+    for statement in statements:
+        schema_editor.execute(statement)
+
+
+def drop_prefix_index(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    statements = {'postgresql': POSTGRESQL_DROP, 'sqlite': SQLITE_DROP}.get(vendor, [])
+
+    for statement in statements:
+        schema_editor.execute(statement)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('store', '0011_book_search_index'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_prefix_index, drop_prefix_index),
+    ]
@@ -0,0 +1,74 @@
+# Generated by Django 4.2.15 on 2026-10-18 04:58
+
+from decimal import ROUND_HALF_EVEN, Decimal
+
+from django.db import migrations, models
+from django.db.models import Count, Min, Q, Sum
+
+
+def remove_duplicate_relations(apps, schema_editor):
+    Book = apps.get_model('store', 'Book')
+    UserBookRelation = apps.get_model('store', 'UserBookRelation')
+
+    duplicates = UserBookRelation.objects.values('user_id', 'book_id').annotate(
+        keep_id=Min('id'), total=Count('id')
+    ).filter(total__gt=1).order_by()
+
+    book_ids = set()
+    for row in duplicates.iterator():
+        UserBookRelation.objects.filter(user_id=row['user_id'], book_id=row['book_id']).exclude(
+            id=row['keep_id']
+        ).delete()
+        book_ids.add(row['book_id'])
+
+    for book_id in book_ids:
+        counters = UserBookRelation.objects.filter(book_id=book_id).aggregate(
+            readers_count=Count('id'),
+            likes_count=Count('id', filter=Q(like=True)),
+            bookmarks_count=Count('id', filter=Q(in_bookmarks=True)),
+            rating_count=Count('rate'),
+            rating_sum=Sum('rate', default=0),
+        )
+        rating = None
+        if counters['rating_count']:
+            # Same rounding as store.models.average_rating, kept inline so the
+            # migration does not change with the model module.
+            rating = (Decimal(counters['rating_sum']) / counters['rating_count']).quantize(
+                Decimal('0.01'), ROUND_HALF_EVEN
+            )
+        Book.objects.filter(pk=book_id).update(rating=rating, **counters)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('store', '0012_book_prefix_index'),
+    ]
+
+    operations = [
+        migrations.RunPython(remove_duplicate_relations, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='book',
+            index=models.Index(fields=['price', 'id'], name='store_book_price_id_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='book',
+            index=models.Index(fields=['author_name', 'id'], name='store_book_author_id_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='userbookrelation',
+            index=models.Index(fields=['book', 'id'], name='store_relation_book_id_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='userbookrelation',
+            index=models.Index(condition=models.Q(('like', True)), fields=['book'], name='store_relation_liked_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='userbookrelation',
+            index=models.Index(condition=models.Q(('in_bookmarks', True)), fields=['user'], name='store_relation_bookmarked_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='userbookrelation',
+            constraint=models.UniqueConstraint(fields=('user', 'book'), name='store_relation_user_book_uniq'),
+        ),
+    ]
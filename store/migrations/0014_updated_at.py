@@ -0,0 +1,50 @@
+# Generated by Django 4.2.15 on 2026-10-18 05:06
+
+from django.db import migrations, models
+
+# The FTS triggers and the prefix indexes of 0011 and 0012, which SQLite
+# drops when AddField rebuilds store_book. The rebuild keeps ids, so the
+# FTS rows stay valid.
+SQLITE_RESTORE = [
+    "CREATE TRIGGER IF NOT EXISTS store_book_fts_insert AFTER INSERT ON store_book BEGIN "
+    "INSERT INTO store_book_fts(rowid, name, author_name) VALUES (new.id, new.name, new.author_name); "
+    "END",
+    "CREATE TRIGGER IF NOT EXISTS store_book_fts_delete AFTER DELETE ON store_book BEGIN "
+    "INSERT INTO store_book_fts(store_book_fts, rowid, name, author_name) "
+    "VALUES ('delete', old.id, old.name, old.author_name); "
+    "END",
+    "CREATE TRIGGER IF NOT EXISTS store_book_fts_update AFTER UPDATE OF name, author_name ON store_book BEGIN "
+    "INSERT INTO store_book_fts(store_book_fts, rowid, name, author_name) "
+    "VALUES ('delete', old.id, old.name, old.author_name); "
+    "INSERT INTO store_book_fts(rowid, name, author_name) VALUES (new.id, new.name, new.author_name); "
+    "END",
+    'CREATE INDEX IF NOT EXISTS store_book_name_nocase_idx ON store_book (name COLLATE NOCASE)',
+    'CREATE INDEX IF NOT EXISTS store_book_author_name_nocase_idx ON store_book (author_name COLLATE NOCASE)',
+]
+
+
+def restore_sqlite_search(apps, schema_editor):
+    if schema_editor.connection.vendor == 'sqlite':
+        for statement in SQLITE_RESTORE:
+            schema_editor.execute(statement)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('store', '0013_relation_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='book',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True, db_index=True),
+        ),
+        migrations.AddField(
+            model_name='userbookrelation',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True),
+        ),
+        migrations.RunPython(restore_sqlite_search, migrations.RunPython.noop),
+    ]
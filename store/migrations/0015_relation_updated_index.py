@@ -0,0 +1,17 @@
+# Generated by Django 4.2.15 on 2026-10-18 05:07
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('store', '0014_updated_at'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='userbookrelation',
+            index=models.Index(fields=['user', 'updated_at', 'id'], name='store_relation_updated_idx'),
+        ),
+    ]
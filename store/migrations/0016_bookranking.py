@@ -0,0 +1,29 @@
+# Generated by Django 4.2.15 on 2026-10-18 05:17
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('store', '0015_relation_updated_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='BookRanking',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('board', models.CharField(choices=[('top-rated', 'Top rated'), ('most-liked', 'Most liked'), ('most-bookmarked', 'Most bookmarked')], max_length=20)),
+                ('position', models.PositiveIntegerField()),
+                ('score', models.FloatField()),
+                ('refreshed_at', models.DateTimeField()),
+                ('book', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='rankings', to='store.book')),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name='bookranking',
+            constraint=models.UniqueConstraint(fields=('board', 'position'), name='store_ranking_board_pos_uniq'),
+        ),
+    ]
@@ -0,0 +1,68 @@
+# Generated by Django 4.2.15 on 2026-10-18 05:40
+
+from decimal import ROUND_HALF_UP, Decimal
+
+from django.db import migrations, models
+
+# The FTS triggers and the prefix indexes as of 0012, which SQLite drops
+# when AddField rebuilds store_book.
+SQLITE_RESTORE = [
+    "CREATE TRIGGER IF NOT EXISTS store_book_fts_insert AFTER INSERT ON store_book BEGIN "
+    "INSERT INTO store_book_fts(rowid, name, author_name) VALUES (new.id, new.name, new.author_name); "
+    "END",
+    "CREATE TRIGGER IF NOT EXISTS store_book_fts_delete AFTER DELETE ON store_book BEGIN "
+    "INSERT INTO store_book_fts(store_book_fts, rowid, name, author_name) "
+    "VALUES ('delete', old.id, old.name, old.author_name); "
+    "END",
+    "CREATE TRIGGER IF NOT EXISTS store_book_fts_update AFTER UPDATE OF name, author_name ON store_book BEGIN "
+    "INSERT INTO store_book_fts(store_book_fts, rowid, name, author_name) "
+    "VALUES ('delete', old.id, old.name, old.author_name); "
+    "INSERT INTO store_book_fts(rowid, name, author_name) VALUES (new.id, new.name, new.author_name); "
+    "END",
+    'CREATE INDEX IF NOT EXISTS store_book_name_nocase_idx ON store_book (name COLLATE NOCASE)',
+    'CREATE INDEX IF NOT EXISTS store_book_author_name_nocase_idx ON store_book (author_name COLLATE NOCASE)',
+]
+
+
+def fill_discounted_price(apps, schema_editor):
+    Book = apps.get_model('store', 'Book')
+    manager = Book.objects.using(schema_editor.connection.alias)
+    books = manager.only('price', 'discount').order_by('pk')
+
+    batch = []
+    for book in books.iterator(chunk_size=2000):
+        discount = book.discount or 0
+        book.discounted_price = (book.price * (100 - discount) / 100).quantize(Decimal('0.01'), rounding=ROUND_HALF_UP)
+        batch.append(book)
+        if len(batch) == 2000:
+            manager.bulk_update(batch, ['discounted_price'])
+            batch = []
+    manager.bulk_update(batch, ['discounted_price'])
+
+
+def restore_sqlite_search(apps, schema_editor):
+    if schema_editor.connection.vendor == 'sqlite':
+        for statement in SQLITE_RESTORE:
+            schema_editor.execute(statement)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('store', '0017_booksimilarity'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='book',
+            name='discounted_price',
+            field=models.DecimalField(decimal_places=2, default=0, editable=False, max_digits=7),
+            preserve_default=False,
+        ),
+        migrations.RunPython(fill_discounted_price, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='book',
+            index=models.Index(fields=['discounted_price', 'id'], name='store_book_discounted_id_idx'),
+        ),
+        migrations.RunPython(restore_sqlite_search, migrations.RunPython.noop),
+    ]
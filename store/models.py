@@ -1,10 +1,29 @@
+from decimal import ROUND_HALF_EVEN, ROUND_HALF_UP, Decimal
+
 from django.contrib.auth.models import User
 from django.core.validators import MinValueValidator, MaxValueValidator
-from django.db import models
+from django.db import models, transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from store.cache import invalidate_books
+
+CENT = Decimal('0.01')
+
+
+def apply_discount(price, discount):
+    return (Decimal(price) * (100 - (discount or 0)) / 100).quantize(CENT, rounding=ROUND_HALF_UP)
+
+
+def average_rating(rating_sum, rating_count):
+    if not rating_count:
+        return None
+    return (Decimal(rating_sum) / rating_count).quantize(CENT, rounding=ROUND_HALF_EVEN)
 
 
 class Book(models.Model):
     DISCOUNT_VALIDATE = [MinValueValidator(0), MaxValueValidator(100)]
+    COUNTER_FIELDS = ('readers_count', 'likes_count', 'bookmarks_count', 'rating_count', 'rating_sum')
 
     name = models.CharField(max_length=255)
     price = models.DecimalField(max_digits=7, decimal_places=2)
@@ -12,11 +31,44 @@ class Book(models.Model):
     owner = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, related_name='owned_books')
     readers = models.ManyToManyField(User, through='UserBookRelation', related_name='books_read')
     discount = models.PositiveSmallIntegerField(default=0, blank=True, validators=DISCOUNT_VALIDATE)
+    # Kept in step with price and discount by save() and by every bulk write.
+    discounted_price = models.DecimalField(max_digits=7, decimal_places=2, editable=False)
     rating = models.DecimalField(max_digits=3, decimal_places=2, null=True, default=None)
+    readers_count = models.PositiveIntegerField(default=0, editable=False)
+    likes_count = models.PositiveIntegerField(default=0, editable=False)
+    bookmarks_count = models.PositiveIntegerField(default=0, editable=False)
+    rating_count = models.PositiveIntegerField(default=0, editable=False)
+    rating_sum = models.PositiveIntegerField(default=0, editable=False)
+    updated_at = models.DateTimeField(auto_now=True, db_index=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['price', 'id'], name='store_book_price_id_idx'),
+            models.Index(fields=['author_name', 'id'], name='store_book_author_id_idx'),
+            models.Index(fields=['discounted_price', 'id'], name='store_book_discounted_id_idx'),
+        ]
 
     def __str__(self):
         return f'ID {self.id}: {self.name}'
 
+    def set_discounted_price(self):
+        self.discounted_price = apply_discount(self.price, self.discount)
+
+    def save(self, *args, **kwargs):
+        self.set_discounted_price()
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None and {'price', 'discount'} & set(update_fields):
+            kwargs['update_fields'] = {*update_fields, 'discounted_price'}
+
+        if not self._state.adding and kwargs.get('update_fields') is None:
+            maintained = self.COUNTER_FIELDS + ('rating',)
+            kwargs['update_fields'] = [
+                field.name for field in self._meta.concrete_fields
+                if not field.primary_key and field.name not in maintained
+            ]
+
+        super().save(*args, **kwargs)
+
 
 class UserBookRelation(models.Model):
     RATE_CHOICES = (
@@ -32,6 +84,18 @@ class UserBookRelation(models.Model):
     like = models.BooleanField(default=False)
     in_bookmarks = models.BooleanField(default=False)
     rate = models.PositiveSmallIntegerField(choices=RATE_CHOICES, null=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'book'], name='store_relation_user_book_uniq'),
+        ]
+        indexes = [
+            models.Index(fields=['book', 'id'], name='store_relation_book_id_idx'),
+            models.Index(fields=['book'], condition=models.Q(like=True), name='store_relation_liked_idx'),
+            models.Index(fields=['user'], condition=models.Q(in_bookmarks=True), name='store_relation_bookmarked_idx'),
+            models.Index(fields=['user', 'updated_at', 'id'], name='store_relation_updated_idx'),
+        ]
 
     def __str__(self):
         return f'{self.user.username}: {self.book.name} - rate {self.rate}'
@@ -39,13 +103,74 @@ class UserBookRelation(models.Model):
     def __init__(self, *args, **kwargs):
         super(UserBookRelation, self).__init__(*args, **kwargs)
         self.old_rate = self.rate
+        self.old_like = self.like
+        self.old_in_bookmarks = self.in_bookmarks
 
     def save(self, *args, **kwargs):
-        from store.utils import set_rating
+        from store.utils import update_counters
 
         creating = not self.pk
+        old_state = None if creating else (self.old_like, self.old_in_bookmarks, self.old_rate)
 
-        super().save(*args, **kwargs)
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+            update_counters(self.book_id, old_state, (self.like, self.in_bookmarks, self.rate))
+
+        self.old_rate = self.rate
+        self.old_like = self.like
+        self.old_in_bookmarks = self.in_bookmarks
+
+
+class DirtyBook(models.Model):
+    book = models.OneToOneField(Book, on_delete=models.CASCADE, primary_key=True)
+    marked_at = models.DateTimeField(auto_now=True, db_index=True)
+
+    def __str__(self):
+        return f'Book {self.book_id} marked at {self.marked_at}'
+
+
+@receiver(post_delete, sender=UserBookRelation)
+def relation_deleted(sender, instance, origin=None, **kwargs):
+    from store.utils import update_counters
+
+    if isinstance(origin, Book) or getattr(origin, 'model', None) is Book:
+        return
+
+    update_counters(instance.book_id, (instance.like, instance.in_bookmarks, instance.rate), None)
+
+
+@receiver(post_save, sender=Book)
+@receiver(post_delete, sender=Book)
+def book_changed(sender, instance, **kwargs):
+    invalidate_books()
+
+
+class BookRanking(models.Model):
+    BOARD_CHOICES = (
+        ('top-rated', 'Top rated'),
+        ('most-liked', 'Most liked'),
+        ('most-bookmarked', 'Most bookmarked'),
+    )
+
+    board = models.CharField(max_length=20, choices=BOARD_CHOICES)
+    position = models.PositiveIntegerField()
+    book = models.ForeignKey(Book, on_delete=models.CASCADE, related_name='rankings')
+    score = models.FloatField()
+    refreshed_at = models.DateTimeField()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['board', 'position'], name='store_ranking_board_pos_uniq'),
+        ]
+
+
+class BookSimilarity(models.Model):
+    book = models.ForeignKey(Book, on_delete=models.CASCADE, related_name='similarities')
+    similar = models.ForeignKey(Book, on_delete=models.CASCADE, related_name='+')
+    position = models.PositiveSmallIntegerField()
+    score = models.FloatField()
 
-        if self.old_rate != self.rate or creating:
-            set_rating(self.book)
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['book', 'position'], name='store_similarity_book_pos_uniq'),
+        ]
@@ -0,0 +1,131 @@
+import json
+from base64 import urlsafe_b64decode, urlsafe_b64encode
+
+from django.core.exceptions import ValidationError as DjangoValidationError
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import Q
+from rest_framework.exceptions import NotFound, ValidationError
+from rest_framework.pagination import CursorPagination
+from rest_framework.utils.urls import replace_query_param
+
+
+class KeysetPagination(CursorPagination):
+    page_size = 20
+    page_size_query_param = 'page_size'
+    max_page_size = 100
+    ordering = 'id'
+    tie_breaker = 'id'
+
+    def paginate_queryset(self, queryset, request, view=None):
+        queryset = self.get_page_queryset(queryset, request, view)
+        if queryset is None:
+            return None
+        return self.set_page(list(queryset))
+
+    def get_page_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.page_size = self.get_page_size(request)
+        if not self.page_size:
+            return None
+
+        self.base_url = request.build_absolute_uri()
+        self.order_field, self.descending = self.get_ordering(request, queryset, view)
+        self.keys = (self.order_field,) if self.order_field == self.tie_breaker else (self.order_field, self.tie_breaker)
+        self.key_fields = [self.get_key_field(queryset, key) for key in self.keys]
+
+        cursor = self.decode_cursor(request)
+        self.has_cursor = cursor is not None
+        self.reverse = bool(cursor and cursor['reverse'])
+        ascending = self.descending == self.reverse
+
+        if cursor is not None:
+            queryset = queryset.filter(self.get_keyset_filter(cursor['position'], ascending))
+
+        prefix = '' if ascending else '-'
+        return queryset.order_by(*[prefix + key for key in self.keys])[:self.page_size + 1]
+
+    def set_page(self, results):
+        has_more = len(results) > self.page_size
+        self.page = results[:self.page_size]
+        if self.reverse:
+            self.page.reverse()
+
+        self.has_next = has_more if not self.reverse else True
+        self.has_previous = has_more if self.reverse else self.has_cursor
+        return self.page
+
+    def get_ordering(self, request, queryset, view):
+        fields = [field for field in queryset.query.order_by if isinstance(field, str)] or [self.ordering]
+        # The cursor only holds one ordering value besides the tie breaker.
+        keys = [field for field in fields if field.lstrip('-') not in ('pk', self.tie_breaker)]
+        if len(keys) > 1:
+            raise ValidationError({'ordering': ['Ordering by more than one field is not supported.']})
+
+        field = keys[0] if keys else fields[0]
+        name = field.lstrip('-')
+        return self.tie_breaker if name == 'pk' else name, field.startswith('-')
+
+    def get_key_field(self, queryset, key):
+        if key in queryset.query.annotations:
+            return queryset.query.annotations[key].output_field
+        return queryset.model._meta.get_field(key)
+
+    def get_keyset_filter(self, position, ascending):
+        lookup = 'gt' if ascending else 'lt'
+        keyset = Q(**{f'{self.keys[-1]}__{lookup}': position[-1]})
+        for key, value in zip(self.keys[-2::-1], position[-2::-1]):
+            keyset = Q(**{f'{key}__{lookup}': value}) | Q(**{key: value}) & keyset
+        return keyset
+
+    def get_position(self, instance):
+        return [getattr(instance, key) for key in self.keys]
+
+    def get_next_link(self):
+        if not self.has_next or not self.page:
+            return None
+        return self.encode_cursor({'position': self.get_position(self.page[-1]), 'reverse': False})
+
+    def get_previous_link(self):
+        if not self.has_previous or not self.page:
+            return None
+        return self.encode_cursor({'position': self.get_position(self.page[0]), 'reverse': True})
+
+    def decode_cursor(self, request):
+        encoded = request.query_params.get(self.cursor_query_param)
+        if encoded is None:
+            return None
+
+        try:
+            payload = json.loads(urlsafe_b64decode(encoded.encode('ascii')))
+            ordering, position, reverse = payload['o'], payload['p'], payload['r']
+        except (TypeError, ValueError, KeyError, UnicodeEncodeError):
+            raise NotFound(self.invalid_cursor_message)
+
+        expected = ('-' if self.descending else '') + self.order_field
+        if ordering != expected or not isinstance(position, list) or len(position) != len(self.keys):
+            raise NotFound(self.invalid_cursor_message)
+
+        try:
+            position = [field.to_python(value) for field, value in zip(self.key_fields, position)]
+            if None in position:
+                raise NotFound(self.invalid_cursor_message)
+            # The field validators carry the range of the database column where
+            # the backend reports one; SQLite does not, but its driver still
+            # overflows past 64 bits, so an id that no row can have is rejected
+            # here instead of failing the query.
+            for field, value in zip(self.key_fields, position):
+                field.run_validators(value)
+                if isinstance(value, int) and not -2 ** 63 <= value < 2 ** 63:
+                    raise NotFound(self.invalid_cursor_message)
+        except (DjangoValidationError, OverflowError):
+            raise NotFound(self.invalid_cursor_message)
+        return {'position': position, 'reverse': bool(reverse)}
+
+    def encode_cursor(self, cursor):
+        payload = {
+            'o': ('-' if self.descending else '') + self.order_field,
+            'p': cursor['position'],
+            'r': int(cursor['reverse']),
+        }
+        encoded = urlsafe_b64encode(json.dumps(payload, cls=DjangoJSONEncoder, separators=(',', ':')).encode('ascii'))
+        return replace_query_param(self.base_url, self.cursor_query_param, encoded.decode('ascii'))
@@ -0,0 +1,61 @@
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F, FloatField, Sum, Value
+from django.db.models.functions import Cast
+from django.utils import timezone
+
+from store.models import Book, BookRanking
+
+BOARDS = tuple(board for board, _ in BookRanking.BOARD_CHOICES)
+
+
+def weighted_rating(prior_votes):
+    # Bayesian average: every book starts with prior_votes votes at the
+    # catalog mean, so a single 5 does not outrank hundreds of 4.8s.
+    totals = Book.objects.aggregate(votes=Sum('rating_count'), total=Sum('rating_sum'))
+    if not totals['votes']:
+        return None
+
+    mean = totals['total'] / totals['votes']
+    return (Value(prior_votes * mean) + Cast(F('rating_sum'), FloatField())) / (
+        Value(float(prior_votes)) + Cast(F('rating_count'), FloatField())
+    )
+
+
+def board_scores(board):
+    if board == 'most-liked':
+        return Book.objects.filter(likes_count__gt=0).annotate(score=Cast(F('likes_count'), FloatField()))
+    if board == 'most-bookmarked':
+        return Book.objects.filter(bookmarks_count__gt=0).annotate(score=Cast(F('bookmarks_count'), FloatField()))
+
+    score = weighted_rating(settings.STORE_RANKING_PRIOR_VOTES)
+    if score is None:
+        return Book.objects.none()
+    return Book.objects.filter(rating_count__gt=0).annotate(score=score)
+
+
+def refresh_rankings(size=None):
+    size = size or settings.STORE_RANKING_SIZE
+    refreshed_at = timezone.now()
+    rankings = []
+
+    for board in BOARDS:
+        rows = board_scores(board).order_by('-score', 'id').values_list('id', 'score')[:size]
+        rankings.extend(
+            BookRanking(board=board, position=position, book_id=book_id, score=score, refreshed_at=refreshed_at)
+            for position, (book_id, score) in enumerate(rows, 1)
+        )
+
+    with transaction.atomic():
+        BookRanking.objects.all().delete()
+        BookRanking.objects.bulk_create(rankings)
+
+    return len(rankings)
+
+
+def rankings_stale():
+    refreshed_at = BookRanking.objects.values_list('refreshed_at', flat=True).first()
+    if refreshed_at is None:
+        return Book.objects.exists()
+    # Counter updates touch updated_at, which is indexed.
+    return Book.objects.filter(updated_at__gt=refreshed_at).exists()
@@ -0,0 +1,106 @@
+import random
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, DatabaseError, connections
+from django.utils.deprecation import MiddlewareMixin
+from rest_framework.permissions import SAFE_METHODS
+
+read_alias = ContextVar('store_read_alias', default=None)
+
+health = {}
+health_lock = threading.Lock()
+
+
+def replica_healthy(alias):
+    now = time.monotonic()
+    with health_lock:
+        checked = health.get(alias)
+    if checked is not None and now - checked[0] < settings.STORE_REPLICA_HEALTH_TTL:
+        return checked[1]
+
+    try:
+        with connections[alias].cursor() as cursor:
+            cursor.execute('SELECT 1 FROM store_book LIMIT 1')
+        healthy = True
+    except DatabaseError:
+        connections[alias].close()
+        healthy = False
+
+    with health_lock:
+        health[alias] = (now, healthy)
+    return healthy
+
+
+def choose_replica():
+    replicas = [alias for alias in settings.STORE_READ_REPLICAS if replica_healthy(alias)]
+    return random.choice(replicas) if replicas else None
+
+
+# The pin travels with the client in a signed cookie, so whichever worker
+# serves the next read sees it, whatever cache backend is configured.
+PRIMARY_COOKIE = 'store_primary'
+
+
+def pin_to_primary(response, user):
+    response.set_signed_cookie(
+        PRIMARY_COOKIE, str(user.pk), salt=PRIMARY_COOKIE,
+        max_age=settings.STORE_REPLICA_STICKY_SECONDS, httponly=True, samesite='Lax'
+    )
+
+
+def pinned_to_primary(request):
+    if not request.user.is_authenticated:
+        return False
+    pinned = request.get_signed_cookie(
+        PRIMARY_COOKIE, default=None, salt=PRIMARY_COOKIE, max_age=settings.STORE_REPLICA_STICKY_SECONDS
+    )
+    return pinned == str(request.user.pk)
+
+
+@contextmanager
+def read_replica(request):
+    alias = None
+    if settings.STORE_READ_REPLICAS and request.method in SAFE_METHODS and not pinned_to_primary(request):
+        alias = choose_replica()
+
+    token = read_alias.set(alias)
+    try:
+        yield alias
+    finally:
+        read_alias.reset(token)
+
+
+class ReplicaRouter:
+    def db_for_read(self, model, **hints):
+        return read_alias.get()
+
+    def db_for_write(self, model, **hints):
+        # Without this, saving an instance read from a replica would follow
+        # the instance back to the replica.
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        databases = {DEFAULT_DB_ALIAS, *settings.STORE_READ_REPLICAS}
+        if obj1._state.db in databases and obj2._state.db in databases:
+            return True
+        return None
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        if db in settings.STORE_READ_REPLICAS:
+            return False
+        return None
+
+
+class ReadYourWritesMiddleware(MiddlewareMixin):
+    # Serve a user's reads from the primary for a few seconds after each of
+    # their writes, so replication lag never hides their own changes.
+    def process_response(self, request, response):
+        user = getattr(request, 'user', None)
+        if request.method not in SAFE_METHODS and user is not None and user.is_authenticated \
+                and response.status_code < 400:
+            pin_to_primary(response, user)
+        return response
@@ -0,0 +1,82 @@
+from itertools import chain
+
+from django.db import connections
+from django.db.models import BooleanField, F, FloatField
+from django.db.models.expressions import RawSQL
+from django.db.models.functions import Collate, Upper
+from rest_framework.filters import SearchFilter
+
+from store.models import Book
+
+# The query must repeat the expression of the GIN index from migration 0011
+# for the planner to use it.
+POSTGRESQL_DOCUMENT = "to_tsvector('simple', \"store_book\".\"name\" || ' ' || \"store_book\".\"author_name\")"
+
+
+def postgresql_query(terms):
+    lexemes = ("'%s':*" % term.replace('\\', '\\\\').replace("'", "''") for term in terms)
+    return ' & '.join(lexemes)
+
+
+def sqlite_query(terms):
+    return ' AND '.join('"%s"*' % term.replace('"', '""') for term in terms)
+
+
+def prefix_ordering(field):
+    # Order by the expression of the prefix index from migration 0012 so the
+    # database reads matches in index order and stops at the limit.
+    vendor = connections[Book.objects.db].vendor
+    if vendor == 'postgresql':
+        return Collate(Upper(field), 'C')
+    if vendor == 'sqlite':
+        return Collate(F(field), 'NOCASE')
+    return F(field)
+
+
+def suggest_books(prefix, limit):
+    fields = ('id', 'name', 'author_name')
+    by_name = Book.objects.filter(name__istartswith=prefix).order_by(prefix_ordering('name'), 'id')
+    by_author = Book.objects.filter(author_name__istartswith=prefix).order_by(prefix_ordering('author_name'), 'id')
+
+    # Title matches come first, then author matches, each in the order the
+    # database returned them, so a cut at the limit never skips a row.
+    suggestions = {}
+    for row in chain(by_name.values(*fields)[:limit], by_author.values(*fields)[:limit]):
+        suggestions.setdefault(row['id'], row)
+    return list(suggestions.values())[:limit]
+
+
+class BookSearchFilter(SearchFilter):
+    rank_field = 'search_rank'
+
+    def filter_queryset(self, request, queryset, view):
+        terms = self.get_search_terms(request)
+        if not terms:
+            return queryset
+
+        vendor = connections[queryset.db].vendor
+        if vendor == 'postgresql':
+            query = postgresql_query(terms)
+            queryset = queryset.filter(
+                RawSQL(f"{POSTGRESQL_DOCUMENT} @@ to_tsquery('simple', %s)", (query,), output_field=BooleanField())
+            )
+            # ts_rank returns real; compared with the float8 the cursor carries,
+            # a rank rounded to real would skip or repeat rows at page edges.
+            rank = RawSQL(
+                f"ts_rank({POSTGRESQL_DOCUMENT}, to_tsquery('simple', %s))::float8", (query,), output_field=FloatField()
+            )
+        elif vendor == 'sqlite':
+            # Joining the FTS table runs the MATCH once and gives bm25() the
+            # row being ranked, a correlated rank subquery would repeat the
+            # MATCH for every matching book. extra() is the only way to add
+            # a table to the FROM clause without a relation to it.
+            queryset = queryset.extra(
+                tables=['store_book_fts'],
+                where=['store_book_fts MATCH %s', 'store_book_fts.rowid = "store_book"."id"'],
+                params=[sqlite_query(terms)],
+            )
+            rank = RawSQL('-bm25(store_book_fts)', (), output_field=FloatField())
+        else:
+            return super().filter_queryset(request, queryset, view)
+
+        return queryset.annotate(**{self.rank_field: rank}).order_by(f'-{self.rank_field}', '-id')
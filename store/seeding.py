@@ -0,0 +1,108 @@
+import math
+import random
+from collections import defaultdict
+from decimal import Decimal
+from itertools import accumulate
+
+from django.contrib.auth.models import User
+from django.db import transaction
+
+from store.cache import invalidate_books
+from store.models import Book, UserBookRelation, average_rating
+
+# Share of each rate among the relations that carry one. Real catalogs are
+# J-shaped: mostly 4s and 5s, few 1s and 2s.
+RATE_WEIGHTS = {1: 0.05, 2: 0.08, 3: 0.17, 4: 0.35, 5: 0.35}
+RATED_SHARE = 0.6
+DISCOUNTS = (0, 0, 0, 0, 0, 0, 5, 10, 15, 20, 25, 50)
+
+
+def zipf_weights(count, exponent):
+    # Cumulative weights, the k-th most popular item is picked with
+    # probability proportional to 1 / k ** exponent.
+    return list(accumulate(1 / rank ** exponent for rank in range(1, count + 1)))
+
+
+def relation_state(generator):
+    rate = None
+    if generator.random() < RATED_SHARE:
+        rate = generator.choices(list(RATE_WEIGHTS), weights=list(RATE_WEIGHTS.values()))[0]
+    like = generator.random() < (0.7 if rate and rate >= 4 else 0.15)
+    in_bookmarks = generator.random() < 0.15
+    return like, in_bookmarks, rate
+
+
+def seed_bookstore(books, users, relations, seed=0, exponent=1.1, batch_size=5000):
+    generator = random.Random(seed)
+    relations = min(relations, books * users)
+
+    # Heavy readers and bestsellers: both sides of a relation are Zipfian.
+    # Repeated pairs are redrawn, a bounded number of times since the tail
+    # pairs get rare when relations approach books * users.
+    book_weights = zipf_weights(books, exponent)
+    user_weights = zipf_weights(users, exponent * 0.8)
+    pairs = {}
+    for _ in range(50):
+        if len(pairs) >= relations:
+            break
+        missing = relations - len(pairs)
+        for pair in zip(
+            generator.choices(range(users), cum_weights=user_weights, k=missing),
+            generator.choices(range(books), cum_weights=book_weights, k=missing),
+        ):
+            if pair not in pairs:
+                pairs[pair] = relation_state(generator)
+
+    # bulk_create bypasses the signals and saves that maintain counters and
+    # ratings, so they are computed from the generated relations instead.
+    counters = defaultdict(lambda: dict.fromkeys(Book.COUNTER_FIELDS, 0))
+    for (_, book), (like, in_bookmarks, rate) in pairs.items():
+        values = counters[book]
+        values['readers_count'] += 1
+        values['likes_count'] += like
+        values['bookmarks_count'] += in_bookmarks
+        values['rating_count'] += rate is not None
+        values['rating_sum'] += rate or 0
+
+    # Popularity is shuffled over ids, so low ids are not all bestsellers.
+    order = list(range(books))
+    generator.shuffle(order)
+    authors = zipf_weights(max(books // 20, 1), exponent)
+
+    with transaction.atomic():
+        first_user = User.objects.count()
+        created_users = User.objects.bulk_create(
+            [User(username=f'seed-user-{first_user + i}') for i in range(users)], batch_size=batch_size
+        )
+
+        created_books = []
+        for index in order:
+            values = counters[index]
+            rating = average_rating(values['rating_sum'], values['rating_count'])
+            price = min(math.exp(generator.gauss(math.log(15), 0.6)), 9999)
+            book = Book(
+                name=f'Book {index}',
+                price=Decimal(f'{price:.2f}'),
+                author_name=f'Author {generator.choices(range(len(authors)), cum_weights=authors)[0] + 1}',
+                discount=generator.choice(DISCOUNTS),
+                rating=rating,
+                **values,
+            )
+            book.set_discounted_price()
+            created_books.append(book)
+        created_books = Book.objects.bulk_create(created_books, batch_size=batch_size)
+        book_ids = {index: book.pk for index, book in zip(order, created_books)}
+
+        UserBookRelation.objects.bulk_create(
+            [
+                UserBookRelation(
+                    user_id=created_users[user].pk, book_id=book_ids[book],
+                    like=like, in_bookmarks=in_bookmarks, rate=rate,
+                )
+                for (user, book), (like, in_bookmarks, rate) in pairs.items()
+            ],
+            batch_size=batch_size,
+        )
+        invalidate_books()
+
+    return books, users, len(pairs)
@@ -1,8 +1,13 @@
+import decimal
+from functools import lru_cache
+from operator import attrgetter
+
 from django.contrib.auth.models import User
 from rest_framework import serializers
+from rest_framework.settings import api_settings
 from rest_framework.serializers import ModelSerializer
 
-from store.models import Book, UserBookRelation
+from store.models import Book, BookRanking, BookSimilarity, UserBookRelation
 
 
 class BookReaderSerializer(serializers.ModelSerializer):
@@ -16,18 +21,133 @@ class BookSerializer(ModelSerializer):
     rating = serializers.DecimalField(max_digits=3, decimal_places=2, read_only=True)
     discounted_price = serializers.DecimalField(max_digits=7, decimal_places=2, read_only=True)
     owner_name = serializers.CharField(read_only=True)
-    readers = BookReaderSerializer(many=True, read_only=True)
+    readers_count = serializers.IntegerField(read_only=True)
+    readers = serializers.SerializerMethodField()
 
     class Meta:
         model = Book
         fields = (
             'id', 'name', 'price',
             'discounted_price', 'author_name', 'likes_count',
-            'rating', 'owner_name',  'readers'
+            'rating', 'owner_name', 'readers_count', 'readers'
         )
 
+    def get_readers(self, instance):
+        return BookReaderSerializer(book_readers(instance), many=True).data
+
+
+def book_readers(instance):
+    relations = getattr(instance, 'top_relations', None)
+    return [relation.user for relation in relations] if relations is not None else instance.readers.all()
+
+
+def decimal_converter(field):
+    exponent = decimal.Decimal('.1') ** field.decimal_places
+    context = decimal.getcontext().copy()
+    context.prec = field.max_digits
+    rounding = field.rounding
+
+    def convert(value):
+        if not isinstance(value, decimal.Decimal):
+            value = decimal.Decimal(str(value).strip())
+        return '{:f}'.format(value.quantize(exponent, rounding=rounding, context=context))
+
+    return convert
+
+
+def field_converter(field):
+    if isinstance(field, serializers.DecimalField):
+        coerce_to_string = getattr(field, 'coerce_to_string', api_settings.COERCE_DECIMAL_TO_STRING)
+        plain = coerce_to_string and not field.localize and not field.normalize_output
+        if plain and field.max_digits is not None and field.decimal_places is not None:
+            return decimal_converter(field)
+    elif isinstance(field, serializers.IntegerField):
+        return int
+    elif isinstance(field, serializers.CharField):
+        return str
+    return field.to_representation
+
+
+@lru_cache(maxsize=None)
+def representation_plan(serializer_class):
+    plan = []
+    for field in serializer_class()._readable_fields:
+        if isinstance(field, serializers.SerializerMethodField):
+            plan.append((field.field_name, None, field.method_name))
+        else:
+            plan.append((field.field_name, attrgetter('.'.join(field.source_attrs)), field_converter(field)))
+    return tuple(plan)
+
+
+def represent(instance, plan, serializer=None):
+    row = {}
+    for name, getter, convert in plan:
+        if getter is None:
+            row[name] = getattr(serializer, convert)(instance)
+        else:
+            value = getter(instance)
+            row[name] = None if value is None else convert(value)
+    return row
+
+
+class BookFastSerializer(serializers.BaseSerializer):
+    # Renders exactly what BookSerializer renders, with each field's
+    # conversion resolved once per process instead of once per value.
+    serializer_class = BookSerializer
+
+    def to_representation(self, instance):
+        return represent(instance, representation_plan(self.serializer_class), self)
+
+    def get_readers(self, instance):
+        plan = representation_plan(BookReaderSerializer)
+        return [represent(reader, plan) for reader in book_readers(instance)]
+
 
 class UserBookRelationSerializer(ModelSerializer):
     class Meta:
         model = UserBookRelation
         fields = ('book', 'like', 'in_bookmarks', 'rate')
+
+
+class UserBookRelationBulkSerializer(ModelSerializer):
+    book = serializers.IntegerField(min_value=1)
+
+    class Meta:
+        model = UserBookRelation
+        fields = ('book', 'like', 'in_bookmarks', 'rate')
+
+
+class BookImportSerializer(ModelSerializer):
+    class Meta:
+        model = Book
+        fields = ('name', 'price', 'author_name', 'discount')
+
+
+class BookRankingSerializer(ModelSerializer):
+    name = serializers.CharField(source='book.name')
+    author_name = serializers.CharField(source='book.author_name')
+    price = serializers.DecimalField(source='book.price', max_digits=7, decimal_places=2)
+    rating = serializers.DecimalField(source='book.rating', max_digits=3, decimal_places=2)
+    rating_count = serializers.IntegerField(source='book.rating_count')
+    likes_count = serializers.IntegerField(source='book.likes_count')
+    bookmarks_count = serializers.IntegerField(source='book.bookmarks_count')
+
+    class Meta:
+        model = BookRanking
+        fields = (
+            'position', 'score', 'book', 'name', 'author_name', 'price',
+            'rating', 'rating_count', 'likes_count', 'bookmarks_count'
+        )
+
+
+class BookSimilaritySerializer(ModelSerializer):
+    id = serializers.IntegerField(source='similar_id')
+    name = serializers.CharField(source='similar.name')
+    author_name = serializers.CharField(source='similar.author_name')
+    price = serializers.DecimalField(source='similar.price', max_digits=7, decimal_places=2)
+    rating = serializers.DecimalField(source='similar.rating', max_digits=3, decimal_places=2)
+    likes_count = serializers.IntegerField(source='similar.likes_count')
+
+    class Meta:
+        model = BookSimilarity
+        fields = ('id', 'name', 'author_name', 'price', 'rating', 'likes_count', 'score')
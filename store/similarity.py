@@ -0,0 +1,131 @@
+from concurrent.futures import ProcessPoolExecutor
+
+from django.db import transaction
+from django.db.models.functions import Coalesce
+
+from store.models import BookSimilarity, UserBookRelation
+
+# Weight of each signal in a user's interest in a book. A rate only counts
+# above 3, so a poor rating is not read as a vote for the book.
+LIKE_WEIGHT = 1.0
+BOOKMARK_WEIGHT = 0.5
+RATE_WEIGHT = 0.5
+
+worker_state = {}
+
+
+def load_interactions(chunk_size):
+    import numpy as np
+
+    users, books, weights = [], [], []
+    last_id = 0
+
+    while True:
+        rows = list(
+            UserBookRelation.objects.filter(pk__gt=last_id).order_by('pk').values_list(
+                'pk', 'user_id', 'book_id', 'like', 'in_bookmarks', Coalesce('rate', 0)
+            )[:chunk_size]
+        )
+        if not rows:
+            break
+        last_id = rows[-1][0]
+
+        chunk = np.array(rows, dtype=np.int64)
+        weight = (
+            chunk[:, 3] * LIKE_WEIGHT + chunk[:, 4] * BOOKMARK_WEIGHT
+            + np.clip(chunk[:, 5] - 3, 0, None) * RATE_WEIGHT
+        )
+        keep = weight > 0
+        users.append(chunk[keep, 1])
+        books.append(chunk[keep, 2])
+        weights.append(weight[keep])
+
+    if not users:
+        return np.empty(0, np.int64), np.empty(0, np.int64), np.empty(0)
+    return np.concatenate(users), np.concatenate(books), np.concatenate(weights)
+
+
+def item_matrices(users, books, weights):
+    import numpy as np
+    from scipy import sparse
+
+    _, user_index = np.unique(users, return_inverse=True)
+    book_ids, book_index = np.unique(books, return_inverse=True)
+    matrix = sparse.csr_matrix(
+        (weights, (user_index, book_index)), shape=(user_index.max() + 1, len(book_ids))
+    )
+    matrix.sum_duplicates()
+
+    # Unit length book columns turn the item-item product into cosine similarity.
+    norms = np.sqrt(np.asarray(matrix.multiply(matrix).sum(axis=0))).ravel()
+    matrix = (matrix @ sparse.diags(1 / norms)).tocsc()
+    return book_ids, matrix.T.tocsr(), matrix
+
+
+def init_worker(items, matrix, k):
+    worker_state.update(items=items, matrix=matrix, k=k)
+
+
+def block_neighbours(bounds):
+    import numpy as np
+
+    start, stop = bounds
+    k = worker_state['k']
+    scores = (worker_state['items'][start:stop] @ worker_state['matrix']).tocsr()
+
+    results = []
+    for row in range(stop - start):
+        columns = scores.indices[scores.indptr[row]:scores.indptr[row + 1]]
+        values = scores.data[scores.indptr[row]:scores.indptr[row + 1]]
+        other = columns != start + row
+        columns, values = columns[other], values[other]
+        if len(columns) > k:
+            top = np.argpartition(-values, k)[:k]
+            columns, values = columns[top], values[top]
+        order = np.lexsort((columns, -values))
+        results.append((start + row, columns[order], values[order]))
+    return results
+
+
+def build_similarities(k, chunk_size=100000, block_size=1000, workers=None, batch_size=5000):
+    users, books, weights = load_interactions(chunk_size)
+    if len(books):
+        book_ids, items, matrix = item_matrices(users, books, weights)
+        blocks = [(start, min(start + block_size, len(book_ids))) for start in range(0, len(book_ids), block_size)]
+    else:
+        book_ids, items, matrix, blocks = [], None, None, []
+
+    if workers == 1 or not blocks:
+        init_worker(items, matrix, k)
+        results = [block_neighbours(block) for block in blocks]
+    else:
+        # The pool computes before the transaction opens, so no transaction
+        # is held open while the workers run. Each worker receives the
+        # matrices once, then only block bounds.
+        with ProcessPoolExecutor(workers, initializer=init_worker, initargs=(items, matrix, k)) as pool:
+            results = list(pool.map(block_neighbours, blocks))
+
+    with transaction.atomic():
+        BookSimilarity.objects.all().delete()
+        return write_similarities(book_ids, results, batch_size)
+
+
+def write_similarities(book_ids, results, batch_size):
+    batch = []
+    total = 0
+    for block in results:
+        for index, neighbours, scores in block:
+            batch.extend(
+                BookSimilarity(
+                    book_id=int(book_ids[index]), similar_id=int(book_ids[neighbour]),
+                    position=position, score=float(score)
+                )
+                for position, (neighbour, score) in enumerate(zip(neighbours, scores), 1)
+            )
+        if len(batch) >= batch_size:
+            BookSimilarity.objects.bulk_create(batch)
+            total += len(batch)
+            batch = []
+
+    BookSimilarity.objects.bulk_create(batch)
+    return total + len(batch)
@@ -1,16 +1,30 @@
 import json
+from base64 import urlsafe_b64encode
+from datetime import timedelta
+from unittest import mock, skipUnless
+from urllib.parse import parse_qs, urlparse
 
+from asgiref.sync import async_to_sync
 from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
 from django.db import connection
-from django.db.models import Count, Case, When, Avg, ExpressionWrapper, F, DecimalField, Prefetch
+from django.db.models import F, Prefetch
+from django.test import override_settings
 from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
+from django.utils import timezone
 from rest_framework import status
 from rest_framework.exceptions import ErrorDetail
 from rest_framework.test import APITestCase
 
-from store.models import Book, UserBookRelation
+from store.instrumentation import BudgetExceeded, registry
+from store.models import Book, BookSimilarity, UserBookRelation
+from store.rankings import refresh_rankings
+from store.routers import PRIMARY_COOKIE, ReplicaRouter, health, read_replica, replica_healthy
 from store.serializers import BookSerializer
+from store.utils import encode_since
+from store.views import BookViewSet, UserBookRelationView
 
 
 class BookAPITestCase(APITestCase):
@@ -37,12 +51,6 @@ class BookAPITestCase(APITestCase):
             self.assertEqual(2, len(queries))
 
         books = Book.objects.all().annotate(
-            likes_count=Count(Case(When(userbookrelation__like=True, then=1))),
-            
-            discounted_price=ExpressionWrapper(
-                F('price') * (1 - F('discount') / 100.0),
-                output_field=DecimalField()
-            ),
             owner_name=F('owner__username')
         ).prefetch_related(
             Prefetch('readers', queryset=User.objects.only('first_name', 'last_name'))
@@ -50,24 +58,142 @@ class BookAPITestCase(APITestCase):
 
         serializer_data = BookSerializer(books, many=True).data
         self.assertEqual(status.HTTP_200_OK, response.status_code)
-        self.assertEqual(serializer_data, response.data)
+        self.assertEqual(serializer_data, response.data['results'])
         self.assertEqual(serializer_data[0]['rating'], '5.00')
         self.assertEqual(serializer_data[0]['likes_count'], 1)
         self.assertEqual(serializer_data[0]['discounted_price'], '9.90')
         self.assertEqual(serializer_data[0]['owner_name'], 'test user')
 
+    def test_get_stream(self):
+        url = reverse('book-list')
+        UserBookRelation.objects.create(user=self.user2, book=self.book3, in_bookmarks=True)
+
+        with mock.patch.object(BookViewSet, 'stream_chunk_size', 2):
+            with CaptureQueriesContext(connection) as queries:
+                response = self.client.get(url, data={'stream': '1', 'ordering': '-price'})
+                lines = b''.join(response.streaming_content).decode().splitlines()
+                self.assertEqual(3, len(queries))
+
+        books = self.client.get(url, data={'ordering': '-price'}).data['results']
+        self.assertEqual(status.HTTP_200_OK, response.status_code)
+        self.assertEqual('application/x-ndjson', response['Content-Type'])
+        self.assertEqual(json.loads(json.dumps(books)), [json.loads(line) for line in lines])
+        self.assertEqual([{'first_name': '', 'last_name': ''}], json.loads(lines[0])['readers'])
+
+    def test_get_stream_accept(self):
+        response = self.client.get(reverse('book-list'), HTTP_ACCEPT='application/x-ndjson')
+
+        self.assertEqual('application/x-ndjson', response['Content-Type'])
+        lines = b''.join(response.streaming_content).splitlines()
+        self.assertEqual([self.book1.id, self.book2.id, self.book3.id], [json.loads(line)['id'] for line in lines])
+
+    @override_settings(STORE_CACHE_ALLOW_LOCAL=True)
+    def test_get_cached(self):
+        url = reverse('book-list')
+
+        response = self.client.get(url, data={'ordering': 'price', 'page_size': 2})
+        self.assertEqual('MISS', response['X-Cache'])
+
+        with CaptureQueriesContext(connection) as queries:
+            cached = self.client.get(f'{url}?page_size=2&ordering=price')
+            self.assertEqual(0, len(queries))
+        self.assertEqual('HIT', cached['X-Cache'])
+        self.assertEqual(response.content, cached.content)
+
+        detail_url = reverse('book-detail', args=(self.book1.id,))
+        self.assertEqual('MISS', self.client.get(detail_url)['X-Cache'])
+        self.assertEqual('HIT', self.client.get(detail_url)['X-Cache'])
+
+        UserBookRelation.objects.create(user=self.user2, book=self.book1, like=True)
+        response = self.client.get(detail_url)
+        self.assertEqual('MISS', response['X-Cache'])
+        self.assertEqual(2, response.data['likes_count'])
+
+        self.book2.name = 'Renamed'
+        self.book2.save()
+        response = self.client.get(url, data={'ordering': 'price', 'page_size': 2})
+        self.assertEqual('MISS', response['X-Cache'])
+        self.assertEqual('Renamed', response.data['results'][1]['name'])
+
+    def test_get_detail_not_modified(self):
+        url = reverse('book-detail', args=(self.book1.id,))
+
+        response = self.client.get(url)
+        etag, last_modified = response['ETag'], response['Last-Modified']
+
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+            self.assertEqual(1, len(queries))
+        self.assertEqual(status.HTTP_304_NOT_MODIFIED, response.status_code)
+        self.assertEqual(etag, response['ETag'])
+        self.assertEqual(b'', response.content)
+
+        response = self.client.get(url, HTTP_IF_MODIFIED_SINCE=last_modified)
+        self.assertEqual(status.HTTP_304_NOT_MODIFIED, response.status_code)
+
+        UserBookRelation.objects.create(user=self.user2, book=self.book1, like=True)
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(status.HTTP_200_OK, response.status_code)
+        self.assertNotEqual(etag, response['ETag'])
+        self.assertEqual(2, response.data['likes_count'])
+
+    @override_settings(STORE_CACHE_ALLOW_LOCAL=True)
+    def test_get_not_modified(self):
+        url = reverse('book-list')
+
+        response = self.client.get(url, data={'ordering': 'price'})
+        etag = response['ETag']
+        self.assertNotIn('Last-Modified', response)
+        self.assertNotEqual(etag, self.client.get(url)['ETag'])
+
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url, data={'ordering': 'price'}, HTTP_IF_NONE_MATCH=etag)
+            self.assertEqual(0, len(queries))
+        self.assertEqual(status.HTTP_304_NOT_MODIFIED, response.status_code)
+
+        self.book3.delete()
+        response = self.client.get(url, data={'ordering': 'price'}, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(status.HTTP_200_OK, response.status_code)
+        self.assertEqual(2, len(response.data['results']))
+
+    @override_settings(STORE_CACHE_TIMEOUT=0)
+    def test_get_cache_disabled(self):
+        response = self.client.get(reverse('book-list'))
+        self.assertNotIn('X-Cache', response)
+
+    @override_settings(STORE_CACHE_ALLOW_LOCAL=False)
+    def test_get_cache_process_local(self):
+        self.client.get(reverse('book-list'))
+        response = self.client.get(reverse('book-list'))
+        self.assertNotIn('X-Cache', response)
+        self.assertNotIn('ETag', response)
+
+        response = self.client.get(reverse('book-list'), HTTP_IF_NONE_MATCH='*')
+        self.assertEqual(status.HTTP_200_OK, response.status_code)
+
+    @override_settings(STORE_CACHE_ALLOW_LOCAL=True)
+    def test_cache_stats(self):
+        url = reverse('book-cache-stats')
+
+        self.client.force_login(self.user)
+        self.assertEqual(status.HTTP_403_FORBIDDEN, self.client.get(url).status_code)
+
+        self.user.is_staff = True
+        self.user.save()
+        before = self.client.get(url).data
+        self.client.get(reverse('book-list'))
+        self.client.get(reverse('book-list'))
+        after = self.client.get(url).data
+
+        self.assertEqual(before['hits'] + 1, after['hits'])
+        self.assertEqual(before['misses'] + 1, after['misses'])
+
     def test_get_filter(self):
         url = reverse('book-list')
 
         response = self.client.get(url, data={'price': 20})
 
         books = Book.objects.filter(id__in=[self.book2.id, self.book3.id]).annotate(
-            likes_count=Count(Case(When(userbookrelation__like=True, then=1))),
-            
-            discounted_price=ExpressionWrapper(
-                F('price') * (1 - F('discount') / 100.0),
-                output_field=DecimalField()
-            ),
             owner_name=F('owner__username')
         ).prefetch_related(
             Prefetch('readers', queryset=User.objects.only('first_name', 'last_name'))
@@ -75,7 +201,26 @@ class BookAPITestCase(APITestCase):
 
         serializer_data = BookSerializer(books, many=True).data
         self.assertEqual(status.HTTP_200_OK, response.status_code)
-        self.assertEqual(serializer_data, response.data)
+        self.assertEqual(serializer_data, response.data['results'])
+
+    def test_get_discounted_price(self):
+        url = reverse('book-list')
+        self.book2.discount = 55
+        self.book2.save()
+
+        response = self.client.get(url, data={'discounted_price__lte': '9.90'})
+        self.assertEqual([self.book1.id, self.book2.id], [book['id'] for book in response.data['results']])
+        self.assertEqual(['9.90', '9.00'], [book['discounted_price'] for book in response.data['results']])
+
+        response = self.client.get(url, data={'discounted_price__gte': '9.50', 'price__lte': 10})
+        self.assertEqual([self.book1.id], [book['id'] for book in response.data['results']])
+
+        response = self.client.get(url, data={'ordering': 'discounted_price', 'page_size': 1})
+        ids = [book['id'] for book in response.data['results']]
+        while response.data['next']:
+            response = self.client.get(response.data['next'])
+            ids += [book['id'] for book in response.data['results']]
+        self.assertEqual([self.book2.id, self.book1.id, self.book3.id], ids)
 
     def test_get_search(self):
         url = reverse('book-list')
@@ -83,12 +228,6 @@ class BookAPITestCase(APITestCase):
         response = self.client.get(url, data={'search': 'Author 1'})
 
         books = Book.objects.filter(id__in=[self.book1.id, self.book3.id]).annotate(
-            likes_count=Count(Case(When(userbookrelation__like=True, then=1))),
-            
-            discounted_price=ExpressionWrapper(
-                F('price') * (1 - F('discount') / 100.0),
-                output_field=DecimalField()
-            ),
             owner_name=F('owner__username')
         ).prefetch_related(
             Prefetch('readers', queryset=User.objects.only('first_name', 'last_name'))
@@ -96,27 +235,231 @@ class BookAPITestCase(APITestCase):
 
         serializer_data = BookSerializer(books, many=True).data
         self.assertEqual(status.HTTP_200_OK, response.status_code)
-        self.assertEqual(serializer_data, response.data)
+        self.assertEqual(serializer_data, response.data['results'])
+
+    def test_get_search_relevance(self):
+        url = reverse('book-list')
+        book4 = Book.objects.create(name='Dune', price=5, author_name='Frank Herbert')
+        book5 = Book.objects.create(name='Dune Messiah', price=5, author_name='Frank Herbert')
+        book5.name = 'Dune Dune Messiah'
+        book5.save()
+
+        response = self.client.get(url, data={'search': 'dun'})
+        self.assertEqual([book5.id, book4.id], [book['id'] for book in response.data['results']])
+
+        response = self.client.get(url, data={'search': 'herbert messiah'})
+        self.assertEqual([book5.id], [book['id'] for book in response.data['results']])
+
+        book5.delete()
+        response = self.client.get(url, data={'search': 'dune', 'ordering': 'price'})
+        self.assertEqual([book4.id], [book['id'] for book in response.data['results']])
+
+    def test_get_search_word_prefix(self):
+        url = reverse('book-list')
+        book4 = Book.objects.create(name='Dune Messiah', price=5, author_name='Frank Herbert')
+
+        # Terms match the start of a word, not any substring as ILIKE did.
+        for term in ('mess', 'MESSIAH', 'herb'):
+            response = self.client.get(url, data={'search': term})
+            self.assertEqual([book4.id], [book['id'] for book in response.data['results']])
+
+        for term in ('essiah', 'une', 'erbert'):
+            response = self.client.get(url, data={'search': term})
+            self.assertEqual([], response.data['results'])
+
+    @skipUnless(connection.vendor == 'postgresql', 'ranks are compared as float8 on PostgreSQL only')
+    def test_get_search_pages(self):
+        url = reverse('book-list')
+        tied = [Book.objects.create(name='Dune', price=5, author_name='Frank Herbert') for _ in range(3)]
+        ranked = [
+            Book.objects.create(name='Dune Dune Messiah', price=5, author_name='Frank Herbert'),
+            Book.objects.create(name='Dune Dune Dune', price=5, author_name='Frank Herbert'),
+        ]
+
+        response = self.client.get(url, data={'search': 'dune', 'page_size': 10})
+        expected = [book['id'] for book in response.data['results']]
+        self.assertEqual(sorted(book.id for book in tied + ranked), sorted(expected))
+        self.assertEqual([book.id for book in reversed(tied)], expected[-3:])
+
+        ids = []
+        response = self.client.get(url, data={'search': 'dune', 'page_size': 2})
+        while True:
+            ids += [book['id'] for book in response.data['results']]
+            if not response.data['next']:
+                break
+            response = self.client.get(response.data['next'])
+        self.assertEqual(expected, ids)
+
+        ids = []
+        while response.data['previous']:
+            response = self.client.get(response.data['previous'])
+            ids = [book['id'] for book in response.data['results']] + ids
+        self.assertEqual(expected[:len(ids)], ids)
+
+    def test_suggest(self):
+        url = reverse('book-suggest')
+        book4 = Book.objects.create(name='Authority', price=5, author_name='Someone')
+
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url, data={'q': 'auth'})
+            self.assertEqual(2, len(queries))
+
+        self.assertEqual(status.HTTP_200_OK, response.status_code)
+        expected_data = [
+            {'id': book4.id, 'name': 'Authority', 'author_name': 'Someone'},
+            {'id': self.book1.id, 'name': 'Test book 1', 'author_name': 'Author 1'},
+            {'id': self.book2.id, 'name': 'Test book 2', 'author_name': 'Author 2'},
+            {'id': self.book3.id, 'name': 'Test book Author 1', 'author_name': 'Author 3'},
+        ]
+        self.assertEqual(expected_data, response.data)
+
+        response = self.client.get(url, data={'q': 'AUTH', 'limit': 2})
+        self.assertEqual(expected_data[:2], response.data)
+
+        book5 = Book.objects.create(name='Authentic', price=5, author_name='Someone')
+        response = self.client.get(url, data={'q': 'auth', 'limit': 3})
+        self.assertEqual([book5.id, book4.id, self.book1.id], [row['id'] for row in response.data])
+
+        response = self.client.get(url, data={'q': ' '})
+        self.assertEqual([], response.data)
 
     def test_get_ordering(self):
         url = reverse('book-list')
 
         response = self.client.get(url, data={'ordering': '-price'})
         books = Book.objects.all().annotate(
-            likes_count=Count(Case(When(userbookrelation__like=True, then=1))),
-            
-            discounted_price=ExpressionWrapper(
-                F('price') * (1 - F('discount') / 100.0),
-                output_field=DecimalField()
-            ),
             owner_name=F('owner__username')
         ).prefetch_related(
             Prefetch('readers', queryset=User.objects.only('first_name', 'last_name'))
-        ).order_by('-price')
+        ).order_by('-price', '-id')
 
         serializer_data = BookSerializer(books, many=True).data
         self.assertEqual(status.HTTP_200_OK, response.status_code)
-        self.assertEqual(serializer_data, response.data)
+        self.assertEqual(serializer_data, response.data['results'])
+
+    def test_get_pages(self):
+        url = reverse('book-list')
+
+        response = self.client.get(url, data={'page_size': 2})
+        self.assertEqual(status.HTTP_200_OK, response.status_code)
+        self.assertEqual([self.book1.id, self.book2.id], [book['id'] for book in response.data['results']])
+        self.assertIsNone(response.data['previous'])
+
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(response.data['next'])
+            self.assertEqual(2, len(queries))
+            self.assertNotIn('OFFSET', queries[0]['sql'])
+
+        self.assertEqual([self.book3.id], [book['id'] for book in response.data['results']])
+        self.assertIsNone(response.data['next'])
+
+        response = self.client.get(response.data['previous'])
+        self.assertEqual([self.book1.id, self.book2.id], [book['id'] for book in response.data['results']])
+        self.assertIsNone(response.data['previous'])
+
+    def test_get_pages_ordering(self):
+        url = reverse('book-list')
+
+        response = self.client.get(url, data={'ordering': '-price', 'page_size': 1})
+        ids = [book['id'] for book in response.data['results']]
+        while response.data['next']:
+            response = self.client.get(response.data['next'])
+            ids += [book['id'] for book in response.data['results']]
+
+        self.assertEqual([self.book3.id, self.book2.id, self.book1.id], ids)
+
+    def test_get_pages_invalid_cursor(self):
+        url = reverse('book-list')
+
+        response = self.client.get(url, data={'ordering': 'price', 'page_size': 1})
+        cursor = parse_qs(urlparse(response.data['next']).query)['cursor'][0]
+
+        response = self.client.get(url, data={'ordering': 'author_name', 'cursor': cursor})
+        self.assertEqual(status.HTTP_404_NOT_FOUND, response.status_code)
+
+        response = self.client.get(url, data={'cursor': 'garbage'})
+        self.assertEqual(status.HTTP_404_NOT_FOUND, response.status_code)
+
+        for position in (['abc', 1], [{}, 1], [None, 1], [10, 'abc'], [10, 10 ** 30], [10 ** 30, 1]):
+            payload = json.dumps({'o': 'price', 'p': position, 'r': 0}).encode()
+            response = self.client.get(url, data={'ordering': 'price', 'cursor': urlsafe_b64encode(payload).decode()})
+            self.assertEqual(status.HTTP_404_NOT_FOUND, response.status_code)
+
+    def test_get_multiple_ordering(self):
+        response = self.client.get(reverse('book-list'), data={'ordering': 'price,author_name'})
+        self.assertEqual(status.HTTP_400_BAD_REQUEST, response.status_code)
+        self.assertIn('ordering', response.data)
+
+    @override_settings(STORE_TOP_READERS=1)
+    def test_get_top_readers(self):
+        reader = User.objects.create(username='reader', first_name='Second', last_name='Reader')
+        UserBookRelation.objects.create(user=reader, book=self.book1, like=True)
+        url = reverse('book-list')
+
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url)
+            self.assertEqual(2, len(queries))
+
+        self.assertEqual(2, response.data['results'][0]['readers_count'])
+        self.assertEqual([{'first_name': '', 'last_name': ''}], response.data['results'][0]['readers'])
+        self.assertEqual([], response.data['results'][1]['readers'])
+
+    def async_get(self, *args, **kwargs):
+        async def get():
+            return await self.async_client.get(*args, **kwargs)
+        return async_to_sync(get)()
+
+    def test_get_async(self):
+        reader = User.objects.create(username='reader', first_name='Second', last_name='Reader')
+        UserBookRelation.objects.create(user=reader, book=self.book3, rate=3)
+
+        for params in ({}, {'ordering': '-price', 'page_size': 2}, {'search': 'Author 1'}, {'price': 20}):
+            expected = self.client.get(reverse('book-list'), data=params)
+            with CaptureQueriesContext(connection) as queries:
+                response = self.async_get(reverse('book-list-async'), data=params)
+                self.assertEqual(2, len(queries))
+
+            self.assertEqual(status.HTTP_200_OK, response.status_code)
+            self.assertEqual(expected.content, response.content.replace(b'/async/book/', b'/book/'))
+
+        next_url = self.async_get(reverse('book-list-async'), data={'page_size': 2}).json()['next']
+        response = self.async_get(next_url)
+        self.assertEqual([self.book3.id], [book['id'] for book in response.json()['results']])
+
+        response = self.async_get(reverse('book-list-async'), data={'cursor': 'x'})
+        self.assertEqual(status.HTTP_404_NOT_FOUND, response.status_code)
+
+    def test_get_detail_async(self):
+        url = reverse('book-detail-async', args=(self.book1.id,))
+        expected = self.client.get(reverse('book-detail', args=(self.book1.id,)))
+
+        response = self.async_get(url)
+
+        self.assertEqual(status.HTTP_200_OK, response.status_code)
+        self.assertEqual(expected.content, response.content)
+
+        response = self.async_get(reverse('book-detail-async', args=(self.book3.id + 100,)))
+        self.assertEqual(status.HTTP_404_NOT_FOUND, response.status_code)
+        self.assertEqual({'detail': 'Not found.'}, response.json())
+
+    def test_get_readers(self):
+        reader = User.objects.create(username='reader', first_name='Second', last_name='Reader')
+        UserBookRelation.objects.create(user=reader, book=self.book1, like=True)
+        url = reverse('book-readers', args=(self.book1.id,))
+
+        response = self.client.get(url, data={'page_size': 1})
+        self.assertEqual(status.HTTP_200_OK, response.status_code)
+        self.assertEqual([{'first_name': '', 'last_name': ''}], response.data['results'])
+
+        response = self.client.get(response.data['next'])
+        self.assertEqual([{'first_name': 'Second', 'last_name': 'Reader'}], response.data['results'])
+        self.assertIsNone(response.data['next'])
+
+        response = self.client.get(reverse('book-readers', args=(0,)))
+        self.assertEqual(status.HTTP_404_NOT_FOUND, response.status_code)
+
+        response = self.client.get(reverse('book-readers', args=('abc',)))
+        self.assertEqual(status.HTTP_404_NOT_FOUND, response.status_code)
 
     def test_create(self):
         self.assertEqual(3, Book.objects.all().count())
@@ -157,12 +500,6 @@ class BookAPITestCase(APITestCase):
         url = reverse('book-detail', args=(self.book1.id,))
 
         book = Book.objects.filter(id=self.book1.id).annotate(
-            likes_count=Count(Case(When(userbookrelation__like=True, then=1))),
-            
-            discounted_price=ExpressionWrapper(
-                F('price') * (1 - F('discount') / 100.0),
-                output_field=DecimalField()
-            ),
             owner_name=F('owner__username')
         ).prefetch_related(
             Prefetch('readers', queryset=User.objects.only('first_name', 'last_name'))
@@ -246,6 +583,105 @@ class BookAPITestCase(APITestCase):
         self.book1.refresh_from_db()
         self.assertEqual(60, self.book1.price)
 
+    def test_import(self):
+        url = reverse('book-import')
+        content = 'name,price,author_name,discount\nImported 1,12.50,Author 4,10\nImported 2,7,Author 5,\n'
+        upload = SimpleUploadedFile('books.csv', content.encode(), content_type='text/csv')
+
+        self.client.force_login(self.user2)
+        response = self.client.post(url, data={'file': upload})
+
+        self.assertEqual(status.HTTP_201_CREATED, response.status_code)
+        self.assertEqual(2, response.data['imported'])
+        self.assertIn('rows_per_second', response.data)
+        books = Book.objects.filter(name__startswith='Imported').order_by('name')
+        self.assertEqual(
+            [('Imported 1', '12.50', 10, self.user2), ('Imported 2', '7.00', 0, self.user2)],
+            [(book.name, str(book.price), book.discount, book.owner) for book in books]
+        )
+
+    def test_import_byte_order_mark(self):
+        content = 'name,price,author_name\nImported 1,5,Author 4\n'
+        upload = SimpleUploadedFile('books.csv', content.encode('utf-8-sig'), content_type='text/csv')
+
+        self.client.force_login(self.user)
+        response = self.client.post(reverse('book-import'), data={'file': upload})
+
+        self.assertEqual(status.HTTP_201_CREATED, response.status_code)
+        self.assertEqual(['Imported 1'], list(Book.objects.filter(price=5).values_list('name', flat=True)))
+
+    def test_import_invalid(self):
+        url = reverse('book-import')
+        content = '{"name": "Imported 1", "price": "5", "author_name": "A"}\n{"name": "Imported 2", "price": "x"}\n'
+        upload = SimpleUploadedFile('books.jsonl', content.encode())
+
+        self.client.force_login(self.user)
+        response = self.client.post(url, data={'file': upload})
+
+        self.assertEqual(status.HTTP_400_BAD_REQUEST, response.status_code)
+        self.assertEqual('2', response.data['row'])
+        self.assertEqual({'price', 'author_name'}, set(response.data['errors']))
+        self.assertFalse(Book.objects.filter(name__startswith='Imported').exists())
+
+    def test_import_not_authenticated(self):
+        upload = SimpleUploadedFile('books.csv', b'name,price,author_name\nImported,1,A\n')
+        response = self.client.post(reverse('book-import'), data={'file': upload})
+        self.assertEqual(status.HTTP_403_FORBIDDEN, response.status_code)
+
+    def test_export(self):
+        url = reverse('book-export')
+
+        self.client.force_login(self.user)
+        response = self.client.get(url, data={'file_format': 'jsonl', 'search': 'Author 1'})
+
+        self.assertEqual(status.HTTP_200_OK, response.status_code)
+        self.assertEqual('application/x-ndjson', response['Content-Type'])
+        self.book1.refresh_from_db()
+        self.book3.refresh_from_db()
+        rows = [json.loads(line) for line in b''.join(response.streaming_content).decode().splitlines()]
+        expected_data = [
+            {'id': book.id, 'name': book.name, 'price': str(book.price), 'author_name': book.author_name,
+             'discount': book.discount}
+            for book in (self.book1, self.book3)
+        ]
+        self.assertEqual(expected_data, rows)
+
+    def test_leaderboard(self):
+        UserBookRelation.objects.create(user=self.user2, book=self.book2, like=True)
+        UserBookRelation.objects.create(user=self.user2, book=self.book1, like=True)
+        refresh_rankings()
+        url = reverse('book-leaderboard', args=('most-liked',))
+
+        with self.assertNumQueries(1):
+            response = self.client.get(url, data={'limit': 1})
+
+        self.assertEqual(status.HTTP_200_OK, response.status_code)
+        self.assertEqual(1, len(response.data))
+        self.assertEqual(
+            {'position': 1, 'score': 2.0, 'book': self.book1.id, 'name': 'Test book 1', 'likes_count': 2},
+            {key: response.data[0][key] for key in ('position', 'score', 'book', 'name', 'likes_count')}
+        )
+        self.assertEqual(2, len(self.client.get(url).data))
+        self.assertEqual(status.HTTP_404_NOT_FOUND, self.client.get(
+            reverse('book-leaderboard', args=('most-read',))
+        ).status_code)
+
+    def test_similar(self):
+        BookSimilarity.objects.create(book=self.book1, similar=self.book3, position=1, score=0.9)
+        BookSimilarity.objects.create(book=self.book1, similar=self.book2, position=2, score=0.5)
+        url = reverse('book-similar', args=(self.book1.id,))
+
+        with self.assertNumQueries(1):
+            response = self.client.get(url)
+
+        self.assertEqual(status.HTTP_200_OK, response.status_code)
+        self.assertEqual([(self.book3.id, 0.9), (self.book2.id, 0.5)], [(row['id'], row['score']) for row in response.data])
+        self.assertEqual('Test book Author 1', response.data[0]['name'])
+        self.assertEqual(1, len(self.client.get(url, data={'limit': 1}).data))
+        self.assertEqual([], self.client.get(reverse('book-similar', args=(self.book2.id,))).data)
+        self.assertEqual(status.HTTP_404_NOT_FOUND, self.client.get(reverse('book-similar', args=(0,))).status_code)
+        self.assertEqual(status.HTTP_404_NOT_FOUND, self.client.get(reverse('book-similar', args=('abc',))).status_code)
+
 
 class UserBookRelationTestCase(APITestCase):
     def setUp(self):
@@ -308,5 +744,358 @@ class UserBookRelationTestCase(APITestCase):
         response = self.client.patch(url, data=json_data, content_type='application/json')
 
         self.assertEqual(status.HTTP_400_BAD_REQUEST, response.status_code)
-        relation = UserBookRelation.objects.get(user=self.user2, book=self.book1)
-        self.assertEqual(None, relation.rate)
+        self.assertFalse(UserBookRelation.objects.filter(user=self.user2, book=self.book1).exists())
+
+    def test_upsert(self):
+        url = reverse('userbookrelation-detail', args=(self.book1.id,))
+        UserBookRelation.objects.create(user=self.user, book=self.book1, in_bookmarks=True, rate=2)
+        json_data = json.dumps({'like': True, 'rate': 4})
+
+        self.client.force_login(self.user)
+        self.client.get(reverse('book-list'))
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.patch(url, data=json_data, content_type='application/json')
+
+        self.assertEqual(status.HTTP_200_OK, response.status_code)
+        expected_data = {'book': self.book1.id, 'like': True, 'in_bookmarks': True, 'rate': 4}
+        self.assertEqual(expected_data, response.data)
+
+        statements = [query['sql'] for query in queries if 'store_userbookrelation' in query['sql']]
+        self.assertEqual(2, len(statements))
+        self.assertIn('ON CONFLICT', statements[1])
+        self.assertNotIn('in_bookmarks" = EXCLUDED', statements[1])
+
+        self.assertEqual(1, UserBookRelation.objects.filter(user=self.user, book=self.book1).count())
+        self.book1.refresh_from_db()
+        self.assertEqual((1, 1, 1, 1, 4), tuple(getattr(self.book1, field) for field in Book.COUNTER_FIELDS))
+        self.assertEqual('4.00', str(self.book1.rating))
+
+    def test_upsert_missing_book(self):
+        url = reverse('userbookrelation-detail', args=(self.book2.id + 100,))
+        json_data = json.dumps({'like': True})
+
+        self.client.force_login(self.user)
+        response = self.client.patch(url, data=json_data, content_type='application/json')
+
+        self.assertEqual(status.HTTP_404_NOT_FOUND, response.status_code)
+        self.assertFalse(UserBookRelation.objects.exists())
+
+    def test_bulk(self):
+        url = reverse('userbookrelation-bulk')
+        UserBookRelation.objects.create(user=self.user, book=self.book1, in_bookmarks=True, rate=2)
+        UserBookRelation.objects.create(user=self.user2, book=self.book1, rate=5)
+        books = [Book.objects.create(name=f'Bulk book {i}', price=i, author_name='Author') for i in range(50)]
+        items = [{'book': self.book1.id, 'like': True, 'rate': 4}, {'book': self.book2.id, 'in_bookmarks': True}]
+        items += [{'book': book.id, 'like': True, 'rate': 3} for book in books]
+        json_data = json.dumps(items)
+
+        self.client.force_login(self.user)
+        self.client.get(reverse('book-list'))
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.post(url, data=json_data, content_type='application/json')
+
+        self.assertEqual(status.HTTP_200_OK, response.status_code)
+        self.assertLessEqual(len(queries), 15)
+        self.assertEqual(52, len(response.data))
+        self.assertEqual({'book': self.book1.id, 'like': True, 'in_bookmarks': True, 'rate': 4}, response.data[0])
+        self.assertEqual({'book': self.book2.id, 'like': False, 'in_bookmarks': True, 'rate': None}, response.data[1])
+
+        self.book1.refresh_from_db()
+        self.assertEqual((2, 1, 1, 2, 9), tuple(getattr(self.book1, field) for field in Book.COUNTER_FIELDS))
+        self.assertEqual('4.50', str(self.book1.rating))
+        self.book2.refresh_from_db()
+        self.assertEqual((1, 0, 1, 0, 0), tuple(getattr(self.book2, field) for field in Book.COUNTER_FIELDS))
+        self.assertIsNone(self.book2.rating)
+        books[0].refresh_from_db()
+        self.assertEqual('3.00', str(books[0].rating))
+
+    def test_bulk_missing_book(self):
+        url = reverse('userbookrelation-bulk')
+        json_data = json.dumps([{'book': self.book1.id, 'like': True}, {'book': self.book2.id + 100, 'like': True}])
+
+        self.client.force_login(self.user)
+        response = self.client.post(url, data=json_data, content_type='application/json')
+
+        self.assertEqual(status.HTTP_400_BAD_REQUEST, response.status_code)
+        self.assertEqual([f'Book {self.book2.id + 100} does not exist.'], response.data['book'])
+        self.assertFalse(UserBookRelation.objects.exists())
+
+    def test_list(self):
+        url = reverse('userbookrelation-list')
+        UserBookRelation.objects.create(user=self.user, book=self.book1, like=True, rate=4)
+        UserBookRelation.objects.create(user=self.user2, book=self.book2, in_bookmarks=True)
+
+        self.client.force_login(self.user)
+        self.client.get(reverse('book-list'))
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url, data={'books': f'{self.book2.id},{self.book1.id},{self.book2.id + 100}'})
+            relation_queries = [query for query in queries if 'store_userbookrelation' in query['sql']]
+            self.assertEqual(1, len(relation_queries))
+
+        self.assertEqual(status.HTTP_200_OK, response.status_code)
+        self.assertEqual([{'book': self.book1.id, 'like': True, 'in_bookmarks': False, 'rate': 4}], response.data)
+        self.assertEqual(2, UserBookRelation.objects.count())
+
+    def test_list_invalid(self):
+        url = reverse('userbookrelation-list')
+
+        self.client.force_login(self.user)
+        self.assertEqual(status.HTTP_400_BAD_REQUEST, self.client.get(url).status_code)
+        self.assertEqual(status.HTTP_400_BAD_REQUEST, self.client.get(url, data={'books': '1,x'}).status_code)
+
+        self.client.logout()
+        self.assertEqual(status.HTTP_403_FORBIDDEN, self.client.get(url, data={'books': '1'}).status_code)
+
+    @override_settings(STORE_CHANGES_SAFETY_WINDOW=0)
+    def test_changes(self):
+        url = reverse('userbookrelation-changes')
+        UserBookRelation.objects.create(user=self.user, book=self.book1, like=True)
+        UserBookRelation.objects.create(user=self.user2, book=self.book2, like=True)
+
+        self.client.force_login(self.user)
+        response = self.client.get(url)
+
+        self.assertEqual(status.HTTP_200_OK, response.status_code)
+        self.assertEqual([{'book': self.book1.id, 'like': True, 'in_bookmarks': False, 'rate': None}],
+                         response.data['results'])
+        self.assertFalse(response.data['has_more'])
+        since = response.data['since']
+
+        self.client.patch(
+            reverse('userbookrelation-detail', args=(self.book2.id,)),
+            data=json.dumps({'rate': 5}), content_type='application/json'
+        )
+        response = self.client.get(url, data={'since': since})
+
+        self.assertEqual([self.book2.id], [row['book'] for row in response.data['results']])
+        self.assertEqual(5, response.data['results'][-1]['rate'])
+        self.assertNotEqual(since, response.data['since'])
+
+        since = response.data['since']
+        response = self.client.get(url, data={'since': since})
+        self.assertEqual([], response.data['results'])
+        self.assertEqual(since, response.data['since'])
+
+        self.assertEqual(status.HTTP_400_BAD_REQUEST, self.client.get(url, data={'since': 'x'}).status_code)
+        self.assertEqual(status.HTTP_400_BAD_REQUEST, self.client.get(url, data={'since': '1-x'}).status_code)
+
+    @override_settings(STORE_CHANGES_SAFETY_WINDOW=0)
+    @mock.patch.object(UserBookRelationView, 'changes_page_size', 2)
+    def test_changes_pages(self):
+        url = reverse('userbookrelation-changes')
+        book3 = Book.objects.create(name='Test book 3', price=30, author_name='Author 3')
+        for book in (self.book1, self.book2, book3):
+            UserBookRelation.objects.create(user=self.user, book=book, like=True)
+        # Rows stamped in the same microsecond are told apart by id.
+        UserBookRelation.objects.filter(user=self.user).update(updated_at=timezone.now() - timedelta(minutes=1))
+
+        self.client.force_login(self.user)
+        response = self.client.get(url)
+        self.assertEqual([self.book1.id, self.book2.id], [row['book'] for row in response.data['results']])
+        self.assertTrue(response.data['has_more'])
+
+        response = self.client.get(url, data={'since': response.data['since']})
+        self.assertEqual([book3.id], [row['book'] for row in response.data['results']])
+        self.assertFalse(response.data['has_more'])
+
+    def test_changes_safety_window(self):
+        url = reverse('userbookrelation-changes')
+        UserBookRelation.objects.create(user=self.user, book=self.book1, like=True)
+        relations = UserBookRelation.objects.filter(user=self.user)
+        relations.update(updated_at=timezone.now() - timedelta(minutes=1))
+
+        self.client.force_login(self.user)
+        since = self.client.get(url).data['since']
+
+        # A change stamped inside the window is sent again until it is older
+        # than the window, in case an earlier stamped change commits late.
+        UserBookRelation.objects.create(user=self.user, book=self.book2, rate=4)
+        for _ in range(2):
+            response = self.client.get(url, data={'since': since})
+            self.assertEqual([self.book2.id], [row['book'] for row in response.data['results']])
+            self.assertEqual(since, response.data['since'])
+
+        relations.filter(book=self.book2).update(updated_at=timezone.now() - timedelta(seconds=30))
+        response = self.client.get(url, data={'since': since})
+        self.assertEqual([self.book2.id], [row['book'] for row in response.data['results']])
+        self.assertEqual([], self.client.get(url, data={'since': response.data['since']}).data['results'])
+
+        # Tokens issued before the feed was paged are still accepted.
+        moment = UserBookRelation.objects.get(user=self.user, book=self.book2).updated_at
+        old_token = encode_since(moment, 0).split('-')[0]
+        response = self.client.get(url, data={'since': old_token})
+        self.assertEqual([self.book2.id], [row['book'] for row in response.data['results']])
+
+
+@override_settings(STORE_BUDGET_ACTION='raise')
+class InstrumentationTestCase(APITestCase):
+    def setUp(self):
+        self.user = User.objects.create(username='user', is_staff=True)
+        self.book = Book.objects.create(name='Test book 1', price=10, author_name='Author 1', owner=self.user)
+        UserBookRelation.objects.create(user=self.user, book=self.book, like=True, rate=5)
+        registry.clear()
+
+    def test_budgets(self):
+        self.client.force_login(self.user)
+        requests = [
+            ('get', reverse('book-list'), None),
+            ('get', reverse('book-detail', args=(self.book.id,)), None),
+            ('get', reverse('book-suggest'), {'q': 'Test'}),
+            ('get', reverse('userbookrelation-list'), {'books': str(self.book.id)}),
+        ]
+        for method, url, data in requests:
+            response = getattr(self.client, method)(url, data=data)
+            self.assertEqual(status.HTTP_200_OK, response.status_code)
+
+        response = self.client.patch(
+            reverse('userbookrelation-detail', args=(self.book.id,)),
+            data=json.dumps({'rate': 4}), content_type='application/json'
+        )
+        self.assertEqual(status.HTTP_200_OK, response.status_code)
+
+    @override_settings(STORE_SERVER_TIMING=True)
+    def test_server_timing(self):
+        response = self.client.get(reverse('book-list'))
+
+        timing = response['Server-Timing']
+        for metric in ('db;dur=', 'desc="2 queries"', 'app;dur=', 'render;dur=', 'total;dur='):
+            self.assertIn(metric, timing)
+
+    @override_settings(STORE_ROUTE_BUDGETS={'book-list': {'queries': 1}})
+    def test_budget_exceeded(self):
+        with self.assertRaisesMessage(BudgetExceeded, 'GET book-list went over its budget: queries 2 > 1'):
+            self.client.get(reverse('book-list'))
+
+        with override_settings(STORE_BUDGET_ACTION='log'), self.assertLogs('store.instrumentation', 'WARNING'):
+            response = self.client.get(reverse('book-list'), data={'page_size': 5})
+            self.assertEqual(status.HTTP_200_OK, response.status_code)
+
+    @override_settings(STORE_METRICS_TOKEN='scrape')
+    def test_metrics(self):
+        response = self.client.get(reverse('book-list'))
+        size = len(response.content)
+
+        response = self.client.get('/metrics/', HTTP_AUTHORIZATION='Bearer scrape')
+
+        self.assertEqual(status.HTTP_200_OK, response.status_code)
+        content = response.content.decode()
+        self.assertIn('# TYPE bookstore_queries_total counter', content)
+        self.assertIn('bookstore_requests_total{route="book-list",method="GET"} 1', content)
+        self.assertIn('bookstore_queries_total{route="book-list",method="GET"} 2', content)
+        self.assertIn(f'bookstore_response_bytes_total{{route="book-list",method="GET"}} {size}', content)
+
+    @override_settings(STORE_METRICS_TOKEN='scrape')
+    def test_metrics_forbidden(self):
+        for headers in ({}, {'REMOTE_ADDR': '127.0.0.1'}, {'HTTP_AUTHORIZATION': 'Bearer wrong'}):
+            response = self.client.get('/metrics/', **headers)
+            self.assertEqual(status.HTTP_403_FORBIDDEN, response.status_code)
+
+        with override_settings(STORE_METRICS_TOKEN=None):
+            response = self.client.get('/metrics/', HTTP_AUTHORIZATION='Bearer None')
+            self.assertEqual(status.HTTP_403_FORBIDDEN, response.status_code)
+
+        self.client.force_login(User.objects.create(username='staff', is_staff=True))
+        self.assertEqual(status.HTTP_200_OK, self.client.get('/metrics/').status_code)
+
+
+@override_settings(STORE_READ_REPLICAS=['replica_1'])
+class ReplicaRoutingTestCase(APITestCase):
+    def setUp(self):
+        cache.clear()
+        health.clear()
+        self.user = User.objects.create(username='test user')
+        self.book = Book.objects.create(name='Test book 1', price=10, author_name='Author 1', owner=self.user)
+        self.router = ReplicaRouter()
+
+    def request(self, method, user=None):
+        return mock.Mock(method=method, user=user or mock.Mock(is_authenticated=False))
+
+    def test_safe_requests_read_from_replica(self):
+        with mock.patch('store.routers.replica_healthy', return_value=True):
+            with read_replica(self.request('GET')):
+                self.assertEqual('replica_1', self.router.db_for_read(Book))
+                self.assertEqual('default', self.router.db_for_write(Book))
+            with read_replica(self.request('POST')):
+                self.assertIsNone(self.router.db_for_read(Book))
+
+        self.assertIsNone(self.router.db_for_read(Book))
+        self.assertFalse(self.router.allow_migrate('replica_1', 'store'))
+        self.assertIsNone(self.router.allow_migrate('default', 'store'))
+
+    def test_unhealthy_replica_falls_back_to_primary(self):
+        with mock.patch('store.routers.replica_healthy', return_value=False):
+            with read_replica(self.request('GET')):
+                self.assertIsNone(self.router.db_for_read(Book))
+
+    def test_health_check_is_cached(self):
+        with CaptureQueriesContext(connection) as queries:
+            self.assertTrue(replica_healthy('default'))
+            self.assertTrue(replica_healthy('default'))
+        self.assertEqual(1, len(queries))
+
+    def test_reads_stick_to_primary_after_write(self):
+        url = reverse('book-detail', args=(self.book.id,))
+        self.client.force_login(self.user)
+
+        with mock.patch('store.routers.choose_replica', return_value='default') as choose:
+            self.client.get(url)
+            self.assertEqual(1, choose.call_count)
+
+            response = self.client.patch(url, data=json.dumps({'price': 12}), content_type='application/json')
+            self.assertEqual(status.HTTP_200_OK, response.status_code)
+            self.assertEqual(1, choose.call_count)
+
+            response = self.client.get(url)
+            self.assertEqual('12.00', response.data['price'])
+            self.assertEqual(1, choose.call_count)
+
+            self.client.logout()
+            self.client.get(url)
+            self.assertEqual(2, choose.call_count)
+
+    def test_primary_pin_outlives_worker_memory(self):
+        url = reverse('book-detail', args=(self.book.id,))
+        self.client.force_login(self.user)
+
+        response = self.client.patch(url, data=json.dumps({'price': 12}), content_type='application/json')
+        self.assertIn(PRIMARY_COOKIE, response.cookies)
+
+        # Another worker shares nothing in memory with the one that pinned.
+        cache.clear()
+        with mock.patch('store.routers.choose_replica', return_value='default') as choose:
+            self.client.get(url)
+            self.assertEqual(0, choose.call_count)
+
+            self.client.cookies[PRIMARY_COOKIE] = str(self.user.pk)
+            self.client.get(url)
+            self.assertEqual(1, choose.call_count)
+
+
+class AdminTestCase(APITestCase):
+    def setUp(self):
+        self.admin = User.objects.create_superuser(username='admin', password='admin')
+        self.client.force_login(self.admin)
+        self.book = Book.objects.create(name='Test book 1', price=10, author_name='Author 1', owner=self.admin)
+
+    def test_relation_changelist_queries(self):
+        url = reverse('admin:store_userbookrelation_changelist')
+        UserBookRelation.objects.create(user=self.admin, book=self.book, like=True)
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(status.HTTP_200_OK, self.client.get(url).status_code)
+
+        for index in range(5):
+            user = User.objects.create(username=f'reader {index}')
+            book = Book.objects.create(name=f'Book {index}', price=10, author_name='Author', owner=user)
+            UserBookRelation.objects.create(user=user, book=book, rate=3)
+
+        with self.assertNumQueries(len(queries)):
+            response = self.client.get(url)
+        self.assertContains(response, 'reader 4')
+
+    def test_book_changelist_search(self):
+        Book.objects.create(name='Another', price=10, author_name='Someone', owner=self.admin)
+        response = self.client.get(reverse('admin:store_book_changelist'), data={'q': 'test'})
+
+        self.assertEqual(status.HTTP_200_OK, response.status_code)
+        self.assertEqual([self.book], list(response.context['cl'].result_list))
+        self.assertEqual(1, response.context['cl'].result_count)
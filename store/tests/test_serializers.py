@@ -1,10 +1,12 @@
 from django.contrib.auth.models import User
-from django.db.models import Count, Case, When, Avg, F, DecimalField, ExpressionWrapper, Prefetch
+from django.db.models import F, Prefetch
 from django.test import TestCase
+from rest_framework.renderers import JSONRenderer
 
 from store.models import Book, UserBookRelation
-from store.serializers import BookSerializer
+from store.serializers import BookFastSerializer, BookSerializer
 from store.utils import set_rating
+from store.views import BookViewSet, top_readers_prefetch
 
 
 class BookSerializerTestCase(TestCase):
@@ -27,11 +29,6 @@ class BookSerializerTestCase(TestCase):
         UserBookRelation.objects.create(user=user3, book=book2, like=False, rate=2)
 
         books = Book.objects.all().annotate(
-            likes_count=Count(Case(When(userbookrelation__like=True, then=1))),
-            discounted_price=ExpressionWrapper(
-                F('price') * (1 - F('discount') / 100.0),
-                output_field=DecimalField()
-            ),
             owner_name=F('owner__username')
         ).prefetch_related(
             Prefetch('readers', queryset=User.objects.only('first_name', 'last_name'))
@@ -47,6 +44,7 @@ class BookSerializerTestCase(TestCase):
                 'rating': '4.67',
                 'discounted_price': '10.00',
                 'owner_name': user1.username,
+                'readers_count': 3,
                 'readers': [
                     {
                         'first_name': 'Sultan',
@@ -71,6 +69,7 @@ class BookSerializerTestCase(TestCase):
                 'rating': '3.00',
                 'discounted_price': '18.00',
                 'owner_name': None,
+                'readers_count': 3,
                 'readers': [
                     {
                         'first_name': 'Sultan',
@@ -89,3 +88,27 @@ class BookSerializerTestCase(TestCase):
         ]
 
         self.assertEqual(expected_data, data)
+
+
+class BookFastSerializerTestCase(TestCase):
+    def test_same_json(self):
+        user1 = User.objects.create(username='user1', first_name='Sultan', last_name='Sulaimanov')
+        user2 = User.objects.create(username='user2', first_name='Улан')
+
+        book1 = Book.objects.create(name='Test book 1', price='10.05', author_name='Author 1', owner=user1, discount=50)
+        Book.objects.create(name='Книга 2', price='99999.99', author_name='Автор', discount=33)
+        Book.objects.create(name='Test book 3', price='0.01', author_name='Author 3', discount=100)
+
+        UserBookRelation.objects.create(user=user1, book=book1, like=True, rate=5)
+        UserBookRelation.objects.create(user=user2, book=book1, rate=4)
+
+        books = BookViewSet.queryset.prefetch_related('readers')
+        with_top_readers = BookViewSet.queryset.prefetch_related(top_readers_prefetch(1))
+
+        renderer = JSONRenderer()
+        for queryset in (books, with_top_readers):
+            expected = renderer.render(BookSerializer(queryset, many=True).data)
+            self.assertEqual(expected, renderer.render(BookFastSerializer(queryset, many=True).data))
+            self.assertEqual(
+                renderer.render(BookSerializer(queryset[0]).data), renderer.render(BookFastSerializer(queryset[0]).data)
+            )
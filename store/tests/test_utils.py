@@ -1,8 +1,20 @@
+import json
+import os
+import tempfile
+from decimal import Decimal
+from io import StringIO
+
 from django.contrib.auth.models import User
-from django.test import TestCase
+from django.core.management import CommandError, call_command
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
 
-from store.models import Book, UserBookRelation
-from store.utils import set_rating
+from store.models import Book, BookRanking, BookSimilarity, DirtyBook, UserBookRelation, apply_discount
+from store.rankings import rankings_stale, refresh_rankings
+from store.seeding import seed_bookstore
+from store.similarity import build_similarities
+from store.utils import flush_dirty_books, set_rating
 
 
 class SetRatingTestCase(TestCase):
@@ -21,3 +33,359 @@ class SetRatingTestCase(TestCase):
         set_rating(self.book)
         self.book.refresh_from_db()
         self.assertEqual('4.67', str(self.book.rating))
+
+
+class DiscountedPriceTestCase(TestCase):
+    def test_apply_discount(self):
+        self.assertEqual('9.90', str(apply_discount(10, 1)))
+        self.assertEqual('16.99', str(apply_discount(Decimal('19.99'), 15)))
+        self.assertEqual('0.03', str(apply_discount(Decimal('0.05'), 50)))
+        self.assertEqual('0.00', str(apply_discount(Decimal('12.50'), 100)))
+
+    def test_save(self):
+        book = Book.objects.create(name='Test book 1', price=10, author_name='Author 1', discount=10)
+        self.assertEqual('9.00', str(Book.objects.get(pk=book.pk).discounted_price))
+
+        book.price = 20
+        book.save(update_fields=['price'])
+        self.assertEqual('18.00', str(Book.objects.get(pk=book.pk).discounted_price))
+
+
+class BookCountersTestCase(TestCase):
+    def setUp(self):
+        self.user1 = User.objects.create(username='user1')
+        self.user2 = User.objects.create(username='user2')
+        self.book = Book.objects.create(name='Test book 1', price=10, author_name='Author 1')
+
+    def assertCounters(self, readers, likes, bookmarks, rating_count, rating_sum):
+        self.book.refresh_from_db()
+        self.assertEqual(
+            (readers, likes, bookmarks, rating_count, rating_sum),
+            tuple(getattr(self.book, field) for field in Book.COUNTER_FIELDS)
+        )
+
+    def test_create_update_delete(self):
+        relation1 = UserBookRelation.objects.create(user=self.user1, book=self.book, like=True, rate=5)
+        UserBookRelation.objects.create(user=self.user2, book=self.book, in_bookmarks=True, rate=3)
+        self.assertCounters(2, 1, 1, 2, 8)
+
+        relation1.like = False
+        relation1.in_bookmarks = True
+        relation1.rate = 4
+        relation1.save()
+        relation1.save()
+        self.assertCounters(2, 0, 2, 2, 7)
+
+        relation1.delete()
+        self.assertCounters(1, 0, 1, 1, 3)
+
+        self.user2.delete()
+        self.assertCounters(0, 0, 0, 0, 0)
+
+    def test_rating(self):
+        relation1 = UserBookRelation.objects.create(user=self.user1, book=self.book, rate=5)
+        relation2 = UserBookRelation.objects.create(user=self.user2, book=self.book, rate=5)
+        self.book.refresh_from_db()
+        self.assertEqual('5.00', str(self.book.rating))
+
+        relation2.rate = 2
+        relation2.save()
+        self.book.refresh_from_db()
+        self.assertEqual('3.50', str(self.book.rating))
+
+        relation1.rate = None
+        relation1.save()
+        self.book.refresh_from_db()
+        self.assertEqual('2.00', str(self.book.rating))
+
+        relation2.delete()
+        self.book.refresh_from_db()
+        self.assertIsNone(self.book.rating)
+
+        relation1.rate = 3
+        relation1.save()
+        set_rating(self.book)
+        self.assertCounters(1, 0, 0, 1, 3)
+        self.assertEqual('3.00', str(self.book.rating))
+
+    def test_rating_rounds_half_to_even(self):
+        # 33 / 8 = 4.125, which every path has to store as 4.12.
+        for index, rate in enumerate([5, 5, 5, 5, 5, 4, 2, 2]):
+            user = self.user1 if index == 0 else User.objects.create(username=f'rater{index}')
+            UserBookRelation.objects.create(user=user, book=self.book, rate=rate)
+        self.book.refresh_from_db()
+        self.assertEqual('4.12', str(self.book.rating))
+
+        set_rating(self.book)
+        self.assertEqual('4.12', str(self.book.rating))
+        self.book.refresh_from_db()
+        self.assertEqual('4.12', str(self.book.rating))
+
+        call_command('rebuild_book_counters', stdout=StringIO())
+        self.book.refresh_from_db()
+        self.assertEqual('4.12', str(self.book.rating))
+
+        # 35 / 8 = 4.375 rounds up to the even 4.38.
+        relation = UserBookRelation.objects.get(user__username='rater6', book=self.book)
+        relation.rate = 4
+        relation.save()
+        self.book.refresh_from_db()
+        self.assertEqual('4.38', str(self.book.rating))
+
+        relation.rate = 2
+        relation.save()
+        self.book.refresh_from_db()
+        self.assertEqual('4.12', str(self.book.rating))
+
+    def test_book_save_keeps_counters(self):
+        book = Book.objects.get(pk=self.book.pk)
+        UserBookRelation.objects.create(user=self.user1, book=self.book, like=True, rate=5)
+
+        book.price = 20
+        book.save()
+
+        self.assertCounters(1, 1, 0, 1, 5)
+        self.assertEqual(20, self.book.price)
+
+    def test_rebuild(self):
+        UserBookRelation.objects.create(user=self.user1, book=self.book, like=True, rate=5)
+        UserBookRelation.objects.create(user=self.user2, book=self.book, like=True, rate=4)
+        Book.objects.filter(pk=self.book.pk).update(likes_count=10, readers_count=0, rating=None)
+
+        call_command('rebuild_book_counters', stdout=StringIO())
+
+        self.assertCounters(2, 2, 0, 2, 9)
+        self.assertEqual('4.50', str(self.book.rating))
+
+
+@override_settings(STORE_DEFERRED_COUNTERS=True)
+class DeferredCountersTestCase(TestCase):
+    def setUp(self):
+        self.user1 = User.objects.create(username='user1')
+        self.user2 = User.objects.create(username='user2')
+        self.book1 = Book.objects.create(name='Test book 1', price=10, author_name='Author 1')
+        self.book2 = Book.objects.create(name='Test book 2', price=20, author_name='Author 2')
+
+    def test_flush(self):
+        UserBookRelation.objects.create(user=self.user1, book=self.book1, like=True, rate=5)
+        relation = UserBookRelation.objects.create(user=self.user2, book=self.book1, rate=4)
+        relation.rate = 2
+        relation.save()
+        UserBookRelation.objects.create(user=self.user1, book=self.book2, in_bookmarks=True)
+
+        self.book1.refresh_from_db()
+        self.assertEqual(0, self.book1.readers_count)
+        self.assertEqual(2, DirtyBook.objects.count())
+
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(2, flush_dirty_books())
+        aggregates = [query for query in queries if 'GROUP BY' in query['sql']]
+        self.assertEqual(1, len(aggregates))
+
+        self.book1.refresh_from_db()
+        self.book2.refresh_from_db()
+        self.assertEqual((2, 1, 0, 2, 7), tuple(getattr(self.book1, field) for field in Book.COUNTER_FIELDS))
+        self.assertEqual('3.50', str(self.book1.rating))
+        self.assertEqual((1, 0, 1, 0, 0), tuple(getattr(self.book2, field) for field in Book.COUNTER_FIELDS))
+        self.assertIsNone(self.book2.rating)
+        self.assertFalse(DirtyBook.objects.exists())
+
+    def test_command(self):
+        UserBookRelation.objects.create(user=self.user1, book=self.book1, like=True)
+
+        call_command('flush_book_counters', stdout=StringIO())
+
+        self.book1.refresh_from_db()
+        self.assertEqual(1, self.book1.likes_count)
+        self.assertFalse(DirtyBook.objects.exists())
+
+
+@override_settings(STORE_RANKING_PRIOR_VOTES=10)
+class RankingsTestCase(TestCase):
+    def setUp(self):
+        self.single_vote = Book.objects.create(name='Single vote', price=10, author_name='Author 1')
+        self.popular = Book.objects.create(name='Popular', price=10, author_name='Author 2')
+        self.poorly_rated = Book.objects.create(name='Poorly rated', price=10, author_name='Author 3')
+        Book.objects.filter(pk=self.single_vote.pk).update(rating_count=1, rating_sum=5, likes_count=1)
+        Book.objects.filter(pk=self.popular.pk).update(rating_count=20, rating_sum=96, likes_count=3)
+        Book.objects.filter(pk=self.poorly_rated.pk).update(rating_count=10, rating_sum=20, bookmarks_count=2)
+
+    def ranking(self, board):
+        return list(
+            BookRanking.objects.filter(board=board).order_by('position').values_list('book_id', flat=True)
+        )
+
+    def test_refresh(self):
+        self.assertTrue(rankings_stale())
+        self.assertEqual(6, refresh_rankings())
+
+        self.assertEqual([self.popular.pk, self.single_vote.pk, self.poorly_rated.pk], self.ranking('top-rated'))
+        self.assertEqual([self.popular.pk, self.single_vote.pk], self.ranking('most-liked'))
+        self.assertEqual([self.poorly_rated.pk], self.ranking('most-bookmarked'))
+
+        # The catalog mean is 121 / 31, so a single 5 barely moves a book off it.
+        score = BookRanking.objects.get(board='top-rated', book=self.single_vote).score
+        self.assertAlmostEqual((10 * 121 / 31 + 5) / 11, score)
+        self.assertFalse(rankings_stale())
+
+    def test_command(self):
+        call_command('refresh_rankings', size=1, stdout=StringIO())
+
+        self.assertEqual([self.popular.pk], self.ranking('top-rated'))
+        self.assertEqual(3, BookRanking.objects.count())
+
+        self.popular.delete()
+        call_command('refresh_rankings', size=1, stdout=StringIO())
+        self.assertEqual([self.single_vote.pk], self.ranking('top-rated'))
+
+
+class SimilarBooksTestCase(TestCase):
+    def setUp(self):
+        users = [User.objects.create(username=f'user{index}') for index in range(4)]
+        self.books = [Book.objects.create(name=f'Book {index}', price=10, author_name='Author') for index in range(4)]
+        liked = {0: [0, 1, 2], 1: [0, 1], 2: [1, 2], 3: [3]}
+        for user, books in liked.items():
+            for book in books:
+                UserBookRelation.objects.create(user=users[user], book=self.books[book], like=True)
+        # A poor rate is not interest, so it must not link book 3 to book 0.
+        UserBookRelation.objects.create(user=users[3], book=self.books[0], rate=1)
+
+    def neighbours(self, book):
+        return list(
+            BookSimilarity.objects.filter(book=book).order_by('position').values_list('similar_id', flat=True)
+        )
+
+    def test_build(self):
+        for workers in (1, 2):
+            self.assertEqual(6, build_similarities(k=2, chunk_size=3, block_size=2, workers=workers))
+
+            self.assertEqual([self.books[1].pk, self.books[0].pk], self.neighbours(self.books[2]))
+            self.assertEqual([self.books[0].pk, self.books[2].pk], self.neighbours(self.books[1]))
+            self.assertEqual([], self.neighbours(self.books[3]))
+
+        score = BookSimilarity.objects.get(book=self.books[1], position=1).score
+        self.assertAlmostEqual(2 / (3 ** 0.5 * 2 ** 0.5), score)
+
+
+class ExplainBookQueriesTestCase(TestCase):
+    def test_seed_and_explain(self):
+        out = StringIO()
+
+        call_command('explain_book_queries', seed=50, repeat=1, stdout=out)
+
+        self.assertEqual(50, Book.objects.count())
+        self.assertIn('store_book_price_id_idx', out.getvalue())
+
+
+class ImportExportBooksTestCase(TestCase):
+    def test_round_trip(self):
+        owner = User.objects.create(username='publisher')
+        Book.objects.create(name='Book, "quoted"', price='9.99', author_name='Author 1', discount=5)
+        Book.objects.create(name='Книга', price=15, author_name='Автор')
+
+        for file_format in ('csv', 'jsonl'):
+            with tempfile.TemporaryDirectory() as directory:
+                path = os.path.join(directory, f'books.{file_format}')
+                stderr = StringIO()
+                call_command('export_books', path, stderr=stderr)
+                self.assertIn('Exported 2 books', stderr.getvalue())
+
+                stdout = StringIO()
+                call_command('import_books', path, '--owner', 'publisher', '--chunk-size', '1', stdout=stdout)
+                self.assertIn('Imported 2 books', stdout.getvalue())
+                self.assertIn('rows/s', stdout.getvalue())
+
+            imported = Book.objects.filter(owner=owner).order_by('pk')
+            self.assertEqual(
+                [('Book, "quoted"', '9.99', 'Author 1', 5), ('Книга', '15.00', 'Автор', 0)],
+                [(book.name, str(book.price), book.author_name, book.discount) for book in imported]
+            )
+            imported.delete()
+
+    def test_invalid_row(self):
+        with tempfile.NamedTemporaryFile('w', suffix='.csv', delete=False) as file:
+            file.write('name,price,author_name\nGood,1,A\nBad,-,B\n')
+
+        try:
+            with self.assertRaisesMessage(CommandError, 'Row 2'):
+                call_command('import_books', file.name, stdout=StringIO())
+        finally:
+            os.remove(file.name)
+        self.assertFalse(Book.objects.exists())
+
+
+class BenchBookSerializersTestCase(TestCase):
+    def test_bench(self):
+        seed_bookstore(books=30, users=3, relations=60)
+        out = StringIO()
+
+        call_command('bench_book_serializers', limit=30, repeat=1, stdout=out)
+
+        self.assertIn('BookFastSerializer', out.getvalue())
+        self.assertIn('faster', out.getvalue())
+
+
+class BenchSettingsProfilesTestCase(TestCase):
+    def test_child(self):
+        out = StringIO()
+
+        call_command('bench_settings_profiles', child=True, requests=5, stdout=out)
+
+        result = json.loads(out.getvalue())
+        self.assertEqual({'debug', 'middleware', 'request_us_median', 'request_us_p95'}, set(result))
+
+
+class SeedBookstoreTestCase(TestCase):
+    def test_seed(self):
+        out = StringIO()
+
+        call_command('seed_bookstore', books=200, users=50, relations=1000, stdout=out)
+
+        self.assertIn('Seeded 200 books, 50 users and 1000 relations', out.getvalue())
+        self.assertEqual(200, Book.objects.count())
+        self.assertEqual(1000, UserBookRelation.objects.count())
+
+        readers = sorted(Book.objects.values_list('readers_count', flat=True), reverse=True)
+        self.assertGreater(sum(readers[:20]), sum(readers[-100:]))
+        rates = UserBookRelation.objects.exclude(rate=None)
+        self.assertGreater(rates.filter(rate__gte=4).count(), rates.filter(rate__lte=2).count() * 2)
+
+        book = Book.objects.filter(rating_count__gt=0).first()
+        expected = (book.readers_count, book.likes_count, book.bookmarks_count, book.rating_count, book.rating_sum)
+        call_command('rebuild_book_counters', stdout=StringIO())
+        book.refresh_from_db()
+        self.assertEqual(expected, tuple(getattr(book, field) for field in Book.COUNTER_FIELDS))
+
+
+class BenchApiTestCase(TestCase):
+    def test_bench(self):
+        seed_bookstore(books=30, users=5, relations=60)
+        out = StringIO()
+
+        call_command('bench_api', requests=3, concurrency=1, stdout=out)
+
+        results = json.loads(out.getvalue())
+        self.assertEqual({'books': 30, 'relations': 60}, results['dataset'])
+        for name in ('POST userbookrelation-bulk', 'DELETE book-detail', 'POST book-import', 'GET book-cache-stats'):
+            self.assertIn(name, results['routes'])
+        self.assertEqual(30, Book.objects.count())
+        self.assertEqual(5, User.objects.count())
+        for name, result in results['routes'].items():
+            self.assertEqual(0, result['single']['errors'], name)
+            self.assertEqual(0, result['concurrent']['errors'], name)
+            self.assertGreater(result['single']['queries_per_request'], 0)
+            self.assertGreater(result['peak_memory_kb'], 0)
+        self.assertEqual({'p50_ms', 'p95_ms', 'p99_ms'}, {key for key in results['routes']['GET book-list']['single'] if key.startswith('p')})
+
+
+class BenchWsgiAsgiTestCase(TestCase):
+    def test_bench(self):
+        out = StringIO()
+
+        call_command('bench_wsgi_asgi', requests=4, concurrency=2, host='testserver', stdout=out)
+
+        results = json.loads(out.getvalue())
+        self.assertEqual({'wsgi, sync view', 'asgi, sync view', 'asgi, async view'}, set(results))
+        for result in results.values():
+            self.assertEqual(0, result['errors'])
+            self.assertEqual(4, result['requests'])
@@ -1,9 +1,256 @@
-from django.db.models import Avg
+from datetime import datetime, timedelta, timezone as dt_timezone
 
-from store.models import UserBookRelation
+from django.conf import settings
+from django.db import connections, router, transaction
+from django.db.models import Case, Count, DecimalField, F, FloatField, Q, Sum, When
+from django.db.models.functions import Cast, Now
+from django.db.models.lookups import Exact, GreaterThan
+from django.utils import timezone
+
+from store.cache import invalidate_books
+from store.models import Book, DirtyBook, UserBookRelation, average_rating
 
 
 def set_rating(book):
-    rating = UserBookRelation.objects.filter(book=book).aggregate(rating=Avg('rate')).get('rating')
+    totals = UserBookRelation.objects.filter(book=book).aggregate(
+        rating_count=Count('rate'),
+        rating_sum=Sum('rate', default=0),
+    )
+    rating = average_rating(totals['rating_sum'], totals['rating_count'])
+    Book.objects.filter(pk=book.pk).update(rating=rating, updated_at=Now(), **totals)
     book.rating = rating
-    book.save()
+
+
+def rating_expression(count_delta, sum_delta):
+    # The average is rounded half to even in integer cents, the way
+    # average_rating() rounds it, since rounding a float average goes half
+    # up on SQLite and turns 4.125 into 4.13.
+    rating_count = F('rating_count') + count_delta
+    cents = (F('rating_sum') + sum_delta) * 100
+    quotient = cents / rating_count
+    twice_remainder = (cents - quotient * rating_count) * 2
+    rounded = quotient + Case(
+        When(GreaterThan(twice_remainder, rating_count), then=1),
+        When(Exact(twice_remainder, rating_count) & Exact(quotient % 2, 1), then=1),
+        default=0,
+    )
+    return Case(
+        When(GreaterThan(rating_count, 0), then=Cast(rounded, FloatField()) / 100),
+        default=None,
+        output_field=DecimalField(max_digits=3, decimal_places=2),
+    )
+
+
+RELATION_FIELDS = ('like', 'in_bookmarks', 'rate')
+
+
+def relation_counters(state):
+    if state is None:
+        return dict.fromkeys(Book.COUNTER_FIELDS, 0)
+
+    like, in_bookmarks, rate = state
+    return {
+        'readers_count': 1,
+        'likes_count': int(like),
+        'bookmarks_count': int(in_bookmarks),
+        'rating_count': int(rate is not None),
+        'rating_sum': rate or 0,
+    }
+
+
+def update_counters(book_id, old_state, new_state):
+    old, new = relation_counters(old_state), relation_counters(new_state)
+    deltas = {field: new[field] - old[field] for field in Book.COUNTER_FIELDS if new[field] != old[field]}
+
+    if not deltas:
+        return
+
+    if settings.STORE_DEFERRED_COUNTERS:
+        mark_books_dirty([book_id])
+        return
+
+    changes = {field: F(field) + delta for field, delta in deltas.items()}
+    changes['updated_at'] = Now()
+    if 'rating_count' in deltas or 'rating_sum' in deltas:
+        changes['rating'] = rating_expression(deltas.get('rating_count', 0), deltas.get('rating_sum', 0))
+
+    Book.objects.filter(pk=book_id).update(**changes)
+    if set(deltas) - {'bookmarks_count'}:
+        invalidate_books()
+
+
+def refresh_book_counters(book_ids):
+    book_ids = list(book_ids)
+
+    with transaction.atomic():
+        locked = Book.objects.select_for_update().filter(pk__in=book_ids).order_by('pk')
+        book_ids = list(locked.values_list('pk', flat=True))
+
+        rows = UserBookRelation.objects.filter(book_id__in=book_ids).values('book_id').annotate(
+            readers_count=Count('id'),
+            likes_count=Count('id', filter=Q(like=True)),
+            bookmarks_count=Count('id', filter=Q(in_bookmarks=True)),
+            rating_count=Count('rate'),
+            rating_sum=Sum('rate', default=0),
+        ).order_by()
+        counters = {row.pop('book_id'): row for row in rows}
+
+        books = []
+        updated_at = timezone.now()
+        for book_id in book_ids:
+            values = counters.get(book_id, dict.fromkeys(Book.COUNTER_FIELDS, 0))
+            rating = average_rating(values['rating_sum'], values['rating_count'])
+            books.append(Book(pk=book_id, rating=rating, updated_at=updated_at, **values))
+
+        Book.objects.bulk_update(books, Book.COUNTER_FIELDS + ('rating', 'updated_at'))
+        invalidate_books()
+
+    return len(books)
+
+
+def mark_books_dirty(book_ids):
+    DirtyBook.objects.bulk_create([DirtyBook(book_id=book_id) for book_id in book_ids], ignore_conflicts=True)
+
+
+def flush_dirty_books(limit=1000):
+    with transaction.atomic():
+        dirty = DirtyBook.objects.select_for_update(skip_locked=True).order_by('marked_at')[:limit]
+        book_ids = list(dirty.values_list('book_id', flat=True))
+        if not book_ids:
+            return 0
+
+        DirtyBook.objects.filter(book_id__in=book_ids).delete()
+        return refresh_book_counters(book_ids)
+
+
+# The old flags are read in the same statement as the upsert. DO UPDATE only
+# applies when the row still holds them, so a write that landed in between
+# returns no row instead of a wrong counter delta, and the statement is run
+# again on a fresh snapshot. xmax = 0 tells an insert from an update.
+POSTGRESQL_UPSERT = """
+WITH old AS (
+    SELECT "like", in_bookmarks, rate FROM store_userbookrelation
+    WHERE user_id = %(user)s AND book_id = %(book)s
+), upserted AS (
+    INSERT INTO store_userbookrelation (user_id, book_id, "like", in_bookmarks, rate, updated_at)
+    SELECT %(user)s, id, %(like)s, %(in_bookmarks)s, %(rate)s, %(updated_at)s FROM store_book WHERE id = %(book)s
+    ON CONFLICT (user_id, book_id) DO UPDATE SET {assignments}
+    WHERE EXISTS (SELECT 1 FROM old)
+        AND store_userbookrelation."like" = (SELECT "like" FROM old)
+        AND store_userbookrelation.in_bookmarks = (SELECT in_bookmarks FROM old)
+        AND store_userbookrelation.rate IS NOT DISTINCT FROM (SELECT rate FROM old)
+    RETURNING xmax = 0 AS inserted
+)
+SELECT upserted.inserted, old."like", old.in_bookmarks, old.rate FROM upserted LEFT JOIN old ON TRUE
+"""
+
+
+def upsert_relation_postgresql(connection, user, book_id, changes, attempts=3):
+    assignments = ', '.join(
+        f'{name} = EXCLUDED.{name}' for name in map(connection.ops.quote_name, [*changes, 'updated_at'])
+    )
+    params = {
+        'user': user.pk, 'book': book_id, 'updated_at': timezone.now(),
+        'like': False, 'in_bookmarks': False, 'rate': None, **changes,
+    }
+
+    for _ in range(attempts):
+        with connection.cursor() as cursor:
+            cursor.execute(POSTGRESQL_UPSERT.format(assignments=assignments), params)
+            row = cursor.fetchone()
+        if row is not None:
+            return True, None if row[0] else row[1:]
+        if not Book.objects.using(connection.alias).filter(pk=book_id).exists():
+            raise Book.DoesNotExist
+    return False, None
+
+
+def upsert_relation_locked(user, book_id, changes):
+    relations = UserBookRelation.objects.select_for_update().filter(user=user, book_id=book_id)
+    previous = relations.values_list(*RELATION_FIELDS).first()
+
+    if previous is None:
+        # Serialize first writes on the book row so two racing inserts
+        # cannot both be counted as new readers.
+        if not Book.objects.select_for_update().filter(pk=book_id).values_list('pk', flat=True):
+            raise Book.DoesNotExist
+        previous = relations.values_list(*RELATION_FIELDS).first()
+
+    if changes:
+        state = dict(zip(RELATION_FIELDS, previous or (False, False, None)), **changes)
+        UserBookRelation.objects.bulk_create(
+            [UserBookRelation(user=user, book_id=book_id, **state)], update_conflicts=True,
+            unique_fields=['user', 'book'], update_fields=[*changes, 'updated_at']
+        )
+    return previous
+
+
+def upsert_relation(user, book_id, changes):
+    connection = connections[router.db_for_write(UserBookRelation)]
+
+    with transaction.atomic(using=connection.alias):
+        written = False
+        if changes and connection.vendor == 'postgresql':
+            written, previous = upsert_relation_postgresql(connection, user, book_id, changes)
+        if not written:
+            previous = upsert_relation_locked(user, book_id, changes)
+
+        state = dict(zip(RELATION_FIELDS, previous or (False, False, None)))
+        state.update(changes)
+        relation = UserBookRelation(user=user, book_id=book_id, **state)
+
+        if changes:
+            update_counters(book_id, previous, tuple(state[field] for field in RELATION_FIELDS))
+
+    return relation
+
+
+def bulk_upsert_relations(user, items):
+    changes_by_book = {}
+    for item in items:
+        changes = changes_by_book.setdefault(item['book'], {})
+        changes.update((field, item[field]) for field in RELATION_FIELDS if field in item)
+
+    with transaction.atomic():
+        books = Book.objects.select_for_update().filter(pk__in=changes_by_book).order_by('pk')
+        book_ids = list(books.values_list('pk', flat=True))
+        missing = sorted(set(changes_by_book) - set(book_ids))
+        if missing:
+            raise Book.DoesNotExist(missing)
+
+        # One upsert per set of submitted fields, so fields a client left out
+        # keep their stored values instead of being reset to the defaults.
+        groups = {}
+        for book_id, changes in changes_by_book.items():
+            if changes:
+                groups.setdefault(tuple(sorted(changes)), []).append(
+                    UserBookRelation(user=user, book_id=book_id, **changes)
+                )
+
+        for fields, relations in groups.items():
+            UserBookRelation.objects.bulk_create(
+                relations, update_conflicts=True, unique_fields=['user', 'book'],
+                update_fields=[*fields, 'updated_at']
+            )
+
+        if groups:
+            if settings.STORE_DEFERRED_COUNTERS:
+                mark_books_dirty(book_ids)
+            else:
+                refresh_book_counters(book_ids)
+
+    return UserBookRelation.objects.filter(user=user, book_id__in=book_ids).order_by('book_id')
+
+
+EPOCH = datetime(1970, 1, 1, tzinfo=dt_timezone.utc)
+
+
+def encode_since(moment, pk):
+    return f'{(moment - EPOCH) // timedelta(microseconds=1)}-{pk}'
+
+
+def decode_since(token):
+    # Tokens without an id are from before the feed was paged and mean
+    # everything stamped at or after the moment.
+    micros, _, pk = token.partition('-')
+    return EPOCH + timedelta(microseconds=int(micros)), int(pk or 0)
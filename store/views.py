@@ -1,50 +1,378 @@
+import io
+from collections import defaultdict
+from datetime import timedelta
+from itertools import islice
+
+from django.conf import settings
 from django.contrib.auth.models import User
-from django.db.models import Count, Case, When, Avg, ExpressionWrapper, F, DecimalField, Prefetch
+from django.db.models import F, Prefetch, Q, Window
+from django.db.models.functions import RowNumber
+from django.http import Http404, HttpResponse, StreamingHttpResponse
 from django.shortcuts import render
+from django.utils import timezone
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date
 from django_filters.rest_framework import DjangoFilterBackend
+from rest_framework import status
+from rest_framework.decorators import action
+from rest_framework.exceptions import APIException, NotFound, ValidationError
 from rest_framework.mixins import UpdateModelMixin
-from rest_framework.filters import SearchFilter, OrderingFilter
-from rest_framework.permissions import IsAuthenticated
+from rest_framework.filters import OrderingFilter
+from rest_framework.parsers import MultiPartParser
+from rest_framework.permissions import IsAdminUser, IsAuthenticated
+from rest_framework.renderers import JSONRenderer
+from rest_framework.request import Request
+from rest_framework.response import Response
 from rest_framework.viewsets import ModelViewSet, GenericViewSet
 
-from store.models import Book, UserBookRelation
+from store.cache import cache_stats, get_response, list_etag, response_key, set_response
+from store.importexport import FORMATS, BookImportError, export_books, guess_format, import_books
+from store.models import Book, BookRanking, BookSimilarity, UserBookRelation
+from store.pagination import KeysetPagination
+from store.rankings import BOARDS
 from store.permissions import IsOwnerOrStaffOrReadOnly
-from store.serializers import BookSerializer, UserBookRelationSerializer
+from store.renderers import NDJSONRenderer
+from store.routers import read_replica
+from store.search import BookSearchFilter, suggest_books
+from store.serializers import (
+    BookSerializer, BookFastSerializer, UserBookRelationSerializer, BookReaderSerializer,
+    UserBookRelationBulkSerializer, BookRankingSerializer, BookSimilaritySerializer
+)
+from store.utils import RELATION_FIELDS, bulk_upsert_relations, decode_since, encode_since, upsert_relation
+
+
+def top_readers_prefetch(limit):
+    relations = UserBookRelation.objects.select_related('user').only(
+        'book', 'like', 'in_bookmarks', 'rate', 'user__first_name', 'user__last_name'
+    )
+    if limit:
+        relations = relations.annotate(
+            reader_position=Window(RowNumber(), partition_by=F('book_id'), order_by=F('id').asc())
+        ).filter(reader_position__lte=limit)
+    else:
+        relations = relations.none()
+
+    return Prefetch('userbookrelation_set', queryset=relations, to_attr='top_relations')
 
 
 class BookViewSet(ModelViewSet):
-    queryset = Book.objects.all().annotate(
-        likes_count=Count(Case(When(userbookrelation__like=True, then=1))),
-        discounted_price=ExpressionWrapper(
-            F('price') * (1 - F('discount') / 100.0),
-            output_field=DecimalField()
-        ),
-        owner_name=F('owner__username')
-    ).prefetch_related(
-        Prefetch('readers', queryset=User.objects.only('first_name', 'last_name'))
-    ).order_by('id')
+    queryset = Book.objects.all().annotate(owner_name=F('owner__username')).order_by('id')
 
     serializer_class = BookSerializer
     permission_classes = [IsOwnerOrStaffOrReadOnly]
-    filter_backends = [DjangoFilterBackend, SearchFilter, OrderingFilter]
-    filterset_fields = ['price']
+    pagination_class = KeysetPagination
+    renderer_classes = [JSONRenderer, NDJSONRenderer]
+    stream_chunk_size = 500
+    filter_backends = [DjangoFilterBackend, BookSearchFilter, OrderingFilter]
+    filterset_fields = {'price': ['exact', 'gte', 'lte'], 'discounted_price': ['exact', 'gte', 'lte']}
     search_fields = ['name', 'author_name']
-    ordering_fields = ['price', 'author_name']
+    ordering_fields = ['price', 'discounted_price', 'author_name']
+
+    def dispatch(self, request, *args, **kwargs):
+        with read_replica(request):
+            return super().dispatch(request, *args, **kwargs)
+
+    def get_queryset(self):
+        return super().get_queryset().prefetch_related(top_readers_prefetch(settings.STORE_TOP_READERS))
+
+    def get_book_id(self):
+        try:
+            return int(self.kwargs['pk'])
+        except ValueError:
+            raise Http404
+
+    def get_serializer_class(self):
+        if self.action in ('list', 'retrieve'):
+            return BookFastSerializer
+        return super().get_serializer_class()
+
+    def list(self, request, *args, **kwargs):
+        if request.accepted_renderer.format != 'ndjson' and request.query_params.get('stream') != '1':
+            # Deleting a book does not move MAX(updated_at), so the list is
+            # validated by the cache version alone, without a Last-Modified.
+            etag = list_etag(request)
+            if etag is None:
+                return self.cached(super().list, request, *args, **kwargs)
+            return self.conditional(etag, None, super().list, request, *args, **kwargs)
+
+        # The body is produced after dispatch returns, so pin the database
+        # chosen for this request before the router context is gone.
+        queryset = self.filter_queryset(self.get_queryset())
+        queryset = queryset.using(queryset.db)
+        return StreamingHttpResponse(self.stream(queryset), content_type=NDJSONRenderer.media_type)
+
+    def retrieve(self, request, *args, **kwargs):
+        try:
+            updated_at = Book.objects.filter(pk=kwargs['pk']).values_list('updated_at', flat=True).first()
+        except ValueError:
+            updated_at = None
+        if updated_at is None:
+            return self.cached(super().retrieve, request, *args, **kwargs)
+
+        etag = f'"book-{kwargs["pk"]}-{updated_at.timestamp():.6f}"'
+        return self.conditional(etag, int(updated_at.timestamp()), super().retrieve, request, *args, **kwargs)
+
+    def conditional(self, etag, last_modified, view, request, *args, **kwargs):
+        response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+        if response is None:
+            response = self.cached(view, request, *args, **kwargs)
+
+        if response.status_code in (status.HTTP_200_OK, status.HTTP_304_NOT_MODIFIED):
+            response['ETag'] = etag
+            if last_modified is not None:
+                response['Last-Modified'] = http_date(last_modified)
+        return response
+
+    def cached(self, view, request, *args, **kwargs):
+        key = response_key(request)
+        if key is None:
+            return view(request, *args, **kwargs)
+
+        data = get_response(key)
+        if data is not None:
+            return Response(data, headers={'X-Cache': 'HIT'})
+
+        response = view(request, *args, **kwargs)
+        if response.status_code == status.HTTP_200_OK:
+            set_response(key, response.data)
+        response['X-Cache'] = 'MISS'
+        return response
+
+    def stream(self, queryset):
+        # iterator() resolves the readers prefetch once per chunk, so memory
+        # stays bounded by the chunk size rather than the catalog size.
+        books = queryset.iterator(chunk_size=self.stream_chunk_size)
+        renderer = NDJSONRenderer()
+        while True:
+            chunk = list(islice(books, self.stream_chunk_size))
+            if not chunk:
+                break
+            yield renderer.render(self.get_serializer(chunk, many=True).data)
 
     def perform_create(self, serializer):
         serializer.validated_data['owner'] = self.request.user
         serializer.save()
 
+    @action(detail=False)
+    def suggest(self, request):
+        prefix = request.query_params.get('q', '').strip()
+        try:
+            limit = min(int(request.query_params.get('limit', 5)), 20)
+        except ValueError:
+            limit = 5
+
+        if not prefix or limit < 1:
+            return Response([])
+        return Response(suggest_books(prefix, limit))
+
+    @action(detail=True)
+    def readers(self, request, pk=None):
+        book_id = self.get_book_id()
+        if not Book.objects.filter(pk=book_id).exists():
+            raise Http404
+
+        # Paging the relations keeps both the filter and the keyset order on
+        # the (book, id) index; paging User by id read every relation of the
+        # book and sorted the readers on each page.
+        queryset = UserBookRelation.objects.filter(book_id=book_id).select_related('user').only(
+            'book', 'like', 'in_bookmarks', 'rate', 'user__first_name', 'user__last_name'
+        )
+        page = self.paginate_queryset(queryset)
+        readers = [relation.user for relation in page]
+        return self.get_paginated_response(BookReaderSerializer(readers, many=True).data)
+
+    @action(detail=True)
+    def similar(self, request, pk=None):
+        try:
+            limit = min(int(request.query_params.get('limit', 10)), settings.STORE_SIMILAR_BOOKS)
+        except ValueError:
+            limit = 10
+
+        book_id = self.get_book_id()
+        similar = BookSimilarity.objects.filter(book_id=book_id).select_related('similar').order_by('position')
+        similar = list(similar[:max(limit, 0)])
+        if not similar and not Book.objects.filter(pk=book_id).exists():
+            raise Http404
+        return Response(BookSimilaritySerializer(similar, many=True).data)
+
+    @action(detail=False, url_path=r'leaderboard/(?P<board>[\w-]+)', url_name='leaderboard')
+    def leaderboard(self, request, board=None):
+        if board not in BOARDS:
+            raise Http404
+        try:
+            limit = min(int(request.query_params.get('limit', 10)), settings.STORE_RANKING_SIZE)
+        except ValueError:
+            limit = 10
+
+        rankings = BookRanking.objects.filter(board=board).select_related('book').order_by('position')[:max(limit, 0)]
+        return Response(BookRankingSerializer(rankings, many=True).data)
+
+    @action(detail=False, url_path='cache-stats', url_name='cache-stats', permission_classes=[IsAdminUser])
+    def cache_statistics(self, request):
+        return Response(cache_stats())
+
+    @action(
+        detail=False, methods=['post'], url_path='import', url_name='import',
+        permission_classes=[IsAuthenticated], parser_classes=[MultiPartParser]
+    )
+    def import_catalog(self, request):
+        upload = request.FILES.get('file')
+        if upload is None:
+            raise ValidationError({'file': ['No file was submitted.']})
+
+        file_format = self.get_file_format(request.query_params.get('file_format') or guess_format(upload.name))
+        # utf-8-sig drops the byte order mark Excel writes at the start of a CSV.
+        stream = io.TextIOWrapper(upload.file, encoding='utf-8-sig', newline='')
+        try:
+            total, elapsed = import_books(stream, file_format, owner=request.user)
+        except BookImportError as error:
+            raise ValidationError({'row': error.row, 'errors': error.errors})
+        except UnicodeDecodeError:
+            raise ValidationError({'file': ['The file is not UTF-8 encoded.']})
+
+        rate = round(total / elapsed) if elapsed else 0
+        return Response({'imported': total, 'rows_per_second': rate}, status=status.HTTP_201_CREATED)
+
+    @action(detail=False, url_path='export', url_name='export', permission_classes=[IsAuthenticated])
+    def export_catalog(self, request):
+        file_format = self.get_file_format(request.query_params.get('file_format', 'csv'))
+        queryset = self.filter_queryset(Book.objects.all())
+        queryset = queryset.using(queryset.db)
+
+        content_type = 'text/csv' if file_format == 'csv' else 'application/x-ndjson'
+        response = StreamingHttpResponse(export_books(queryset, file_format), content_type=content_type)
+        response['Content-Disposition'] = f'attachment; filename="books.{file_format}"'
+        return response
+
+    def get_file_format(self, file_format):
+        if file_format not in FORMATS:
+            raise ValidationError({'file_format': [f'Expected one of: {", ".join(FORMATS)}.']})
+        return file_format
+
 
 class UserBookRelationView(UpdateModelMixin, GenericViewSet):
     queryset = UserBookRelation.objects.all()
     serializer_class = UserBookRelationSerializer
     permission_classes = [IsAuthenticated]
     lookup_field = 'book'
+    bulk_max_items = 1000
+    changes_page_size = 500
+
+    def get_book_id(self):
+        try:
+            return int(self.kwargs['book'])
+        except ValueError:
+            raise Http404
 
     def get_object(self):
-        obj, _ = UserBookRelation.objects.get_or_create(user=self.request.user, book_id=self.kwargs['book'])
-        return obj
+        return UserBookRelation(user=self.request.user, book_id=self.get_book_id())
+
+    def get_queryset(self):
+        return super().get_queryset().filter(user=self.request.user).only('book', *RELATION_FIELDS)
+
+    def list(self, request, *args, **kwargs):
+        raw = request.query_params.get('books', '')
+        try:
+            book_ids = {int(book_id) for book_id in raw.split(',') if book_id.strip()}
+        except ValueError:
+            raise ValidationError({'books': ['Expected a comma separated list of book ids.']})
+        if not book_ids:
+            raise ValidationError({'books': ['This query parameter is required.']})
+        if len(book_ids) > self.bulk_max_items:
+            raise ValidationError({'books': [f'Ensure there are no more than {self.bulk_max_items} ids.']})
+
+        relations = self.get_queryset().filter(book_id__in=book_ids).order_by('book_id')
+        return Response(self.get_serializer(relations, many=True).data)
+
+    @action(detail=False)
+    def changes(self, request):
+        relations = self.get_queryset().only('book', 'updated_at', *RELATION_FIELDS).order_by('updated_at', 'id')
+        since = request.query_params.get('since')
+        if since:
+            try:
+                moment, last_id = decode_since(since)
+            except (ValueError, OverflowError):
+                raise ValidationError({'since': ['Invalid token.']})
+            relations = relations.filter(Q(updated_at__gt=moment) | Q(updated_at=moment, id__gt=last_id))
+
+        relations = list(relations[:self.changes_page_size + 1])
+        has_more = len(relations) > self.changes_page_size
+        relations = relations[:self.changes_page_size]
+
+        # updated_at is stamped before the transaction commits, so a slow
+        # commit can land behind rows already sent. The token does not move
+        # past rows younger than the safety window, they are sent again and
+        # a client applying them twice ends in the same state.
+        horizon = timezone.now() - timedelta(seconds=settings.STORE_CHANGES_SAFETY_WINDOW)
+        settled = [relation for relation in relations if relation.updated_at <= horizon]
+        if not settled and has_more:
+            # A full page inside the window, move on rather than repeat it.
+            settled = relations
+        token = encode_since(settled[-1].updated_at, settled[-1].pk) if settled else since
+
+        return Response({
+            'since': token,
+            'has_more': has_more,
+            'results': self.get_serializer(relations, many=True).data,
+        })
+
+    def perform_update(self, serializer):
+        changes = {field: value for field, value in serializer.validated_data.items() if field in RELATION_FIELDS}
+        try:
+            serializer.instance = upsert_relation(self.request.user, self.get_book_id(), changes)
+        except Book.DoesNotExist:
+            raise Http404
+
+    @action(detail=False, methods=['post'])
+    def bulk(self, request):
+        serializer = UserBookRelationBulkSerializer(data=request.data, many=True, max_length=self.bulk_max_items)
+        serializer.is_valid(raise_exception=True)
+
+        try:
+            relations = bulk_upsert_relations(request.user, serializer.validated_data)
+        except Book.DoesNotExist as error:
+            raise ValidationError({'book': [f'Book {book_id} does not exist.' for book_id in error.args[0]]})
+        return Response(UserBookRelationSerializer(relations, many=True).data)
+
+
+async def attach_top_readers(books, limit):
+    # QuerySet.aiterator() does not run prefetch_related() in Django 4.2, so
+    # the readers prefetch is issued by hand, still as a single query.
+    relations = top_readers_prefetch(limit).queryset.filter(book_id__in=[book.pk for book in books])
+    by_book = defaultdict(list)
+    async for relation in relations:
+        by_book[relation.book_id].append(relation)
+    for book in books:
+        book.top_relations = by_book[book.pk]
+
+
+def json_response(data, status_code=status.HTTP_200_OK):
+    return HttpResponse(JSONRenderer().render(data), status=status_code, content_type='application/json')
+
+
+async def book_list_async(request):
+    request = Request(request)
+    view = BookViewSet(request=request, args=(), kwargs={}, format_kwarg=None, action='list')
+    paginator = KeysetPagination()
+
+    try:
+        queryset = paginator.get_page_queryset(view.filter_queryset(BookViewSet.queryset.all()), request, view)
+    except APIException as error:
+        return json_response({'detail': error.detail}, error.status_code)
+
+    books = [book async for book in queryset.aiterator()]
+    await attach_top_readers(books, settings.STORE_TOP_READERS)
+    page = paginator.set_page(books)
+    return json_response(paginator.get_paginated_response(BookFastSerializer(page, many=True).data).data)
+
+
+async def book_detail_async(request, pk):
+    book = await BookViewSet.queryset.filter(pk=pk).afirst()
+    if book is None:
+        return json_response({'detail': NotFound.default_detail}, status.HTTP_404_NOT_FOUND)
+
+    await attach_top_readers([book], settings.STORE_TOP_READERS)
+    return json_response(BookFastSerializer(book).data)
 
 
 def auth(request):